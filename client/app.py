@@ -1,35 +1,96 @@
 import uvicorn
-from fastapi import File, UploadFile, FastAPI, Request, Form
+from fastapi import File, UploadFile, FastAPI, Request, Form, HTTPException, Header, Body
+from fastapi.concurrency import run_in_threadpool
 import os
 import yaml
-import zipfile
+from session_upload import extract_archive, get_session_dir, get_file_sizes, verify_files, write_chunk
+from session_ingest import SessionIngestor
 app = FastAPI()
 
+CONFIG_PATH = 'config.yml'
+config_cache = {'mtime': None, 'cfg': None}
+
+def get_config():
+    # site.py may rewrite the config, so it is parsed again only when the file changes
+    mtime = os.stat(CONFIG_PATH).st_mtime_ns
+    if mtime != config_cache['mtime']:
+        with open(CONFIG_PATH, 'r') as f:
+            config_cache['cfg'] = yaml.safe_load(f)
+        config_cache['mtime'] = mtime
+    return config_cache['cfg']
+
+ingest_cfg = get_config()['ingest']
+ingestor = SessionIngestor(ingest_cfg['workers'], ingest_cfg['controllers'])
+
+@app.on_event("startup")
+async def recover_sessions():
+    cfg = get_config()
+    await run_in_threadpool(ingestor.recover, cfg['path']['sessions_path'], cfg['decode'])
+
+@app.on_event("shutdown")
+def stop_ingestor():
+    ingestor.shutdown()
+
 @app.post("/upload")
 async def upload(request: Request, session_name: str = Form(...), file: UploadFile = File(...)):
+    # The multipart body is spooled to a temporary file while it arrives, extraction runs in the thread pool
     if request.headers.get('Type') == "session_part":
         try:
-            with open('config.yml', 'r') as f:
-                cfg = yaml.safe_load(f)
-            sessions_path = cfg['path']['sessions_path']
+            sessions_path = get_config()['path']['sessions_path']
             if not os.path.isdir(sessions_path):
                 print('ERROR: Sessions dir does not exist!')
-            dir = os.path.join(sessions_path, session_name)
-            if not os.path.isdir(dir):
-                os.mkdir(dir)
-            contents = await file.read()
-            file_path = os.path.join(dir, file.filename)
-            with open(file_path, 'wb') as f:
-                f.write(contents)
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(dir)
-            os.remove(file_path)
+            dir = get_session_dir(sessions_path, session_name)
+            await run_in_threadpool(extract_archive, file.file, dir)
+            await run_in_threadpool(ingestor.add_part, dir, get_config()['decode'])
         except Exception as e:
             print("ERROR: ", e)
             return {"message": "There was an error uploading the file"}
         finally:
             await file.close()  
         return {"message": f"Successfuly uploaded {file.filename}"}
+
+@app.get("/stream")
+async def stream_status(session_name: str):
+    try:
+        session_dir = get_session_dir(get_config()['path']['sessions_path'], session_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"files": await run_in_threadpool(get_file_sizes, session_dir)}
+
+@app.post("/stream")
+async def stream(request: Request, session_name: str, path: str, offset: int, x_checksum: str = Header(None)):
+    try:
+        session_dir = get_session_dir(get_config()['path']['sessions_path'], session_name)
+        size = await run_in_threadpool(write_chunk, session_dir, path, offset, await request.body(), x_checksum)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"size": size}
+
+@app.post("/stream/commit")
+async def stream_commit(session_name: str, files: dict = Body(...)):
+    try:
+        session_dir = get_session_dir(get_config()['path']['sessions_path'], session_name)
+        mismatched = await run_in_threadpool(verify_files, session_dir, files)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not mismatched:
+        await run_in_threadpool(ingestor.add_part, session_dir, get_config()['decode'])
+    return {"mismatched": mismatched}
+
+@app.get("/ingest")
+async def ingest_statuses():
+    return {"jobs": ingestor.get_statuses()}
+
+@app.get("/ingest/{session_name}")
+async def ingest_status(session_name: str):
+    try:
+        session_dir = get_session_dir(get_config()['path']['sessions_path'], session_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    status = await run_in_threadpool(ingestor.get_status, session_dir)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f'Session \'{session_name}\' does not exist')
+    return status
         
 if __name__ == '__main__':
     uvicorn.run(app, host='0.0.0.0', port=8000)
\ No newline at end of file
@@ -0,0 +1,207 @@
+import argparse
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import yaml
+from output_formats import available_formats, find_output, read_output
+from session_processor import decode_packages, decode_sensor, get_columns
+
+def create_session(session_dir, n_sensors, n_packages, sample_rate=1000.0):
+    os.makedirs(os.path.join(session_dir, 'metadata'))
+    os.makedirs(os.path.join(session_dir, 'raw_data'))
+    rng = np.random.default_rng(0)
+    session_info = {
+        'name': os.path.basename(session_dir),
+        'devices': {'benchmark': []},
+        'time': {'start': {'benchmark': 0.0}, 'duration': n_packages / sample_rate},
+        'sensors': {},
+        'overflows': {},
+        'files': {},
+        'n_packages': {},
+        'crops': {}
+    }
+    for i in range(n_sensors):
+        sensor_id = f'mpu6050_{i}'
+        session_info['devices']['benchmark'].append(sensor_id)
+        session_info['sensors'][sensor_id] = {
+            'clock_source': 1,
+            'dlpf_mode': 1,
+            'rate': 0,
+            'sample_rate': sample_rate,
+            'full_scale_accel_range': 0,
+            'full_scale_gyro_range': 0,
+            'accel_factor': 2 / 32768.0,
+            'gyro_factor': 250 / 32768.0,
+            'accel_fifo_enabled': True,
+            'x_gyro_fifo_enabled': True,
+            'y_gyro_fifo_enabled': True,
+            'z_gyro_fifo_enabled': True,
+            'package_length': 12
+        }
+        session_info['overflows'][sensor_id] = []
+        session_info['files'][sensor_id] = f'sensor_{sensor_id}'
+        session_info['n_packages'][sensor_id] = n_packages
+        session_info['crops'][sensor_id] = [0, n_packages]
+        data = rng.integers(-32768, 32768, size=n_packages * 6, dtype=np.int16)
+        data.astype('>i2').tofile(os.path.join(session_dir, 'raw_data', f'sensor_{sensor_id}'))
+    with open(os.path.join(session_dir, 'metadata', 'session_info.yml'), 'w') as f:
+        yaml.dump(session_info, f, sort_keys=False)
+    return session_info
+
+def get_factors_list(sensor_info):
+    factors = []
+    if sensor_info['accel_fifo_enabled']:
+        factors += [sensor_info['accel_factor']] * 3
+    for axis in ['x', 'y', 'z']:
+        if sensor_info[f'{axis}_gyro_fifo_enabled']:
+            factors.append(sensor_info['gyro_factor'])
+    return factors
+
+def decode_loop(buffer, sensor_info, crop):
+    package_length = sensor_info['package_length']
+    factors = get_factors_list(sensor_info)
+    data = list(buffer)
+    df = []
+    for j in range(crop[0], crop[1]):
+        package = data[j * package_length : (j + 1) * package_length]
+        package = struct.unpack('>' + 'h' * (package_length // 2), memoryview(bytearray(package)))
+        df.append([package[k] * factor for k, factor in enumerate(factors)])
+    return pd.DataFrame(df, columns=get_columns(sensor_info))
+
+def decode_vectorized(buffer, sensor_info, crop):
+    package_length = sensor_info['package_length']
+    buffer = buffer[crop[0] * package_length : crop[1] * package_length]
+    return pd.DataFrame(decode_packages(buffer, sensor_info), columns=get_columns(sensor_info))
+
+def timeit(func, *args):
+    time_start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - time_start, result
+
+def benchmark_decode(session_dir, session_info):
+    print(f'{"sensor":<12}{"loop, s":>10}{"vectorized, s":>16}{"speedup":>10}')
+    for sensor_id, sensor_info in session_info['sensors'].items():
+        with open(os.path.join(session_dir, 'raw_data', session_info['files'][sensor_id]), 'rb') as f:
+            buffer = f.read()
+        crop = session_info['crops'][sensor_id]
+        loop_time, loop_df = timeit(decode_loop, buffer, sensor_info, crop)
+        vectorized_time, vectorized_df = timeit(decode_vectorized, buffer, sensor_info, crop)
+        if not loop_df.equals(vectorized_df):
+            raise AssertionError(f'Decoded data mismatch for sensor \'{sensor_id}\'')
+        print(f'{sensor_id:<12}{loop_time:>10.3f}{vectorized_time:>16.3f}{loop_time / vectorized_time:>9.1f}x')
+
+def benchmark_formats(session_dir, session_info):
+    sensor_id = next(iter(session_info['sensors']))
+    file_name = session_info['files'][sensor_id]
+    raw_size = os.path.getsize(os.path.join(session_dir, 'raw_data', file_name))
+    print(f'{"format":<10}{"write, s":>10}{"read, s":>10}{"size, MB":>10}{"ratio":>8}')
+    for output_format in available_formats():
+        write_time, _ = timeit(decode_sensor, session_dir, session_info, sensor_id, 65536, output_format)
+        _, file_path = find_output(session_dir, file_name)
+        read_time, (df, _) = timeit(read_output, file_path, output_format)
+        if len(df) != session_info['n_packages'][sensor_id]:
+            raise AssertionError(f'Row count mismatch for format \'{output_format}\'')
+        size = os.path.getsize(file_path)
+        os.remove(file_path)
+        print(f'{output_format:<10}{write_time:>10.3f}{read_time:>10.3f}{size / 2**20:>10.2f}{size / raw_size:>7.2f}x')
+
+def get_peak_memory(pid):
+    with open(f'/proc/{pid}/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def start_server(work_dir, port):
+    with open(os.path.join(work_dir, 'config.yml'), 'w') as f:
+        yaml.dump({'path': {'sessions_path': os.path.join(work_dir, 'sessions')},
+                   'decode': {'chunk_size': 65536, 'workers': 1, 'output_format': 'csv'},
+                   'ingest': {'workers': 1, 'controllers': []}}, f)
+    os.makedirs(os.path.join(work_dir, 'sessions'))
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app:app', '--app-dir', os.path.dirname(os.path.abspath(__file__)),
+                               '--port', str(port), '--log-level', 'warning'], cwd=work_dir)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('Upload server did not start')
+
+def benchmark_upload(session_dir, n_managers, port):
+    # Concurrent zip uploads from n_managers, while a probe measures how long small /stream requests wait
+    import requests
+    work_dir = os.path.join(os.path.dirname(session_dir), 'upload')
+    os.makedirs(work_dir)
+    archive_path = shutil.make_archive(os.path.join(work_dir, 'part'), 'zip', session_dir)
+    server = start_server(work_dir, port)
+    url = f'http://127.0.0.1:{port}'
+    probe_latency = []
+    done = threading.Event()
+    def probe():
+        http = requests.Session()
+        while not done.is_set():
+            time_start = time.perf_counter()
+            http.post(f'{url}/stream', params={'session_name': 'probe', 'path': 'metadata/probe', 'offset': 0}, data=b'probe')
+            probe_latency.append(time.perf_counter() - time_start)
+            time.sleep(0.01)
+    def upload(i):
+        time_start = time.perf_counter()
+        with open(archive_path, 'rb') as f:
+            response = requests.post(f'{url}/upload', headers={'Type': 'session_part'}, data={'session_name': f'session_{i}'},
+                                     files=[('file', (f'part_{i}.zip', f, 'application/zip'))])
+        response.raise_for_status()
+        return time.perf_counter() - time_start
+    try:
+        probe_thread = threading.Thread(target=probe)
+        probe_thread.start()
+        time_start = time.perf_counter()
+        with ThreadPoolExecutor(n_managers) as executor:
+            latency = list(executor.map(upload, range(n_managers)))
+        total_time = time.perf_counter() - time_start
+        done.set()
+        probe_thread.join()
+        peak_memory = get_peak_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    for i in range(n_managers):
+        extracted = os.path.join(work_dir, 'sessions', f'session_{i}', 'metadata', 'session_info.yml')
+        if not os.path.isfile(extracted):
+            raise AssertionError(f'Upload {i} was not extracted')
+    size = os.path.getsize(archive_path)
+    print(f'{n_managers} uploads of {size / 2**20:.1f} MB in {total_time:.2f} s, '
+          f'upload latency max {max(latency):.2f} s, server peak memory {peak_memory / 2**20:.0f} MB')
+    print(f'probe requests: {len(probe_latency)}, median {np.median(probe_latency) * 1000:.1f} ms, '
+          f'max {max(probe_latency) * 1000:.1f} ms')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark session decoding on synthetic data')
+    parser.add_argument('--sensors', type=int, default=2)
+    parser.add_argument('--packages', type=int, default=100000)
+    parser.add_argument('--mode', choices=['decode', 'formats', 'upload'], default='decode')
+    parser.add_argument('--managers', type=int, default=20)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        session_dir = os.path.join(tmp_dir, 'benchmark')
+        session_info = create_session(session_dir, args.sensors, args.packages)
+        if args.mode == 'decode':
+            benchmark_decode(session_dir, session_info)
+        elif args.mode == 'upload':
+            benchmark_upload(session_dir, args.managers, args.port)
+        else:
+            benchmark_formats(session_dir, session_info)
+    finally:
+        shutil.rmtree(tmp_dir)
\ No newline at end of file
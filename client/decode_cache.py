@@ -0,0 +1,68 @@
+import hashlib
+import os
+import yaml
+
+HASH_BLOCK_SIZE = 1 << 20
+
+def get_record_path(session_dir, sensor_id):
+    return os.path.join(session_dir, 'metadata', 'decode_cache', f'{sensor_id}.yml')
+
+def load_record(session_dir, sensor_id):
+    record_path = get_record_path(session_dir, sensor_id)
+    if not os.path.isfile(record_path):
+        return None
+    with open(record_path, 'r') as f:
+        return yaml.safe_load(f)
+
+def save_record(session_dir, sensor_id, record):
+    record_path = get_record_path(session_dir, sensor_id)
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    with open(record_path + '.tmp', 'w') as f:
+        yaml.dump(record, f, sort_keys=False)
+    os.replace(record_path + '.tmp', record_path)
+
+def get_fingerprint(file_path, known=None):
+    stat = os.stat(file_path)
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+
+def get_decode_params(session_info, sensor_id, output_format):
+    params = {
+        'crop': list(session_info['crops'][sensor_id]),
+        'sensor': session_info['sensors'][sensor_id],
+        'output_format': output_format
+    }
+    gaps = session_info.get('gaps', {}).get(sensor_id)
+    if gaps:
+        params['gaps'] = [[gap['package'], gap['length']] for gap in gaps]
+    alignment = session_info.get('alignment', {}).get(sensor_id)
+    if alignment:
+        params['alignment'] = alignment
+    return params
+
+def is_current(session_dir, session_info, sensor_id, output_format=None):
+    record = load_record(session_dir, sensor_id)
+    if record is None:
+        return False
+    if output_format is None:
+        output_format = record['params']['output_format']
+    if record['params'] != get_decode_params(session_info, sensor_id, output_format):
+        return False
+    output_path = os.path.join(session_dir, record['output']['file_name'])
+    if not os.path.isfile(output_path) or os.path.getsize(output_path) != record['output']['size']:
+        return False
+    source_path = os.path.join(session_dir, 'raw_data', session_info['files'][sensor_id])
+    if not os.path.isfile(source_path):
+        return False
+    fingerprint = get_fingerprint(source_path, record['source'])
+    if fingerprint['sha256'] != record['source']['sha256']:
+        return False
+    if fingerprint != record['source']:
+        record['source'] = fingerprint
+        save_record(session_dir, sensor_id, record)
+    return True
\ No newline at end of file
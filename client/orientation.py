@@ -0,0 +1,200 @@
+import math
+import numpy as np
+import pandas as pd
+from session_processor import SessionReader, load_session_info, read_decoded
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+ACCEL_COLUMNS = ['accel_x', 'accel_y', 'accel_z']
+GYRO_COLUMNS = ['gyro_x', 'gyro_y', 'gyro_z']
+QUATERNION_COLUMNS = ['q_w', 'q_x', 'q_y', 'q_z']
+EULER_COLUMNS = ['roll', 'pitch', 'yaw']
+
+DEFAULT_MADGWICK_BETA = 0.1
+DEFAULT_MAHONY_KP = 1.0
+DEFAULT_MAHONY_KI = 0.0
+DEFAULT_COMPLEMENTARY_ALPHA = 0.02
+
+def prepare_inputs(accel, gyro):
+    accel = np.asarray(accel, dtype=np.float64)
+    gyro = np.asarray(gyro, dtype=np.float64)
+    if accel.ndim == 2:
+        accel, gyro = accel[np.newaxis], gyro[np.newaxis]
+    if accel.shape != gyro.shape or accel.shape[-1] != 3:
+        raise ValueError('\'accel\' and \'gyro\' must have equal shapes ending with 3 axes')
+    if np.isnan(accel).any() or np.isnan(gyro).any():
+        # Hold orientation over gaps: repeat the last accel sample with zero rotation
+        valid = ~np.isnan(accel).any(axis=-1)
+        index = np.maximum.accumulate(np.where(valid, np.arange(valid.shape[1]), 0), axis=1)
+        accel = np.nan_to_num(np.take_along_axis(accel, index[..., np.newaxis], axis=1))
+        gyro = np.nan_to_num(gyro)
+    norm = np.sqrt(np.sum(accel * accel, axis=-1, keepdims=True))
+    accel = np.ascontiguousarray(accel / np.where(norm == 0, 1, norm))
+    gyro = np.ascontiguousarray(np.radians(gyro))
+    return accel, gyro
+
+def initial_quaternion(n_sensors, q0=None):
+    q = np.zeros((n_sensors, 4))
+    if q0 is None:
+        q[:, 0] = 1
+    else:
+        q[:] = np.asarray(q0, dtype=np.float64).reshape(-1, 4)
+    return q
+
+def compile_kernel(kernel):
+    # The per-sample recurrence cannot be vectorized over time, numba compiles it to native code.
+    # Without numba the same kernel runs as plain Python, which is correct but far slower.
+    return kernel if njit is None else njit(cache=True, nogil=True)(kernel)
+
+@compile_kernel
+def madgwick_kernel(accel, gyro, dt, beta, q0, result):
+    for j in range(accel.shape[0]):
+        w, x, y, z = q0[j, 0], q0[j, 1], q0[j, 2], q0[j, 3]
+        for i in range(accel.shape[1]):
+            ax, ay, az = accel[j, i, 0], accel[j, i, 1], accel[j, i, 2]
+            gx, gy, gz = gyro[j, i, 0], gyro[j, i, 1], gyro[j, i, 2]
+            f1 = 2 * (x * z - w * y) - ax
+            f2 = 2 * (w * x + y * z) - ay
+            f3 = 1 - 2 * (x * x + y * y) - az
+            s0 = -2 * y * f1 + 2 * x * f2
+            s1 = 2 * z * f1 + 2 * w * f2 - 4 * x * f3
+            s2 = -2 * w * f1 + 2 * z * f2 - 4 * y * f3
+            s3 = 2 * x * f1 + 2 * y * f2
+            norm = math.sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+            norm = beta / norm if norm > 0 else 0.0
+            dw = 0.5 * (-x * gx - y * gy - z * gz) - norm * s0
+            dx = 0.5 * (w * gx + y * gz - z * gy) - norm * s1
+            dy = 0.5 * (w * gy - x * gz + z * gx) - norm * s2
+            dz = 0.5 * (w * gz + x * gy - y * gx) - norm * s3
+            w, x, y, z = w + dw * dt, x + dx * dt, y + dy * dt, z + dz * dt
+            norm = 1 / math.sqrt(w * w + x * x + y * y + z * z)
+            w, x, y, z = w * norm, x * norm, y * norm, z * norm
+            result[j, i, 0], result[j, i, 1], result[j, i, 2], result[j, i, 3] = w, x, y, z
+
+@compile_kernel
+def mahony_kernel(accel, gyro, dt, kp, ki, q0, result):
+    for j in range(accel.shape[0]):
+        w, x, y, z = q0[j, 0], q0[j, 1], q0[j, 2], q0[j, 3]
+        ix, iy, iz = 0.0, 0.0, 0.0
+        for i in range(accel.shape[1]):
+            ax, ay, az = accel[j, i, 0], accel[j, i, 1], accel[j, i, 2]
+            gx, gy, gz = gyro[j, i, 0], gyro[j, i, 1], gyro[j, i, 2]
+            vx = 2 * (x * z - w * y)
+            vy = 2 * (w * x + y * z)
+            vz = w * w - x * x - y * y + z * z
+            ex = ay * vz - az * vy
+            ey = az * vx - ax * vz
+            ez = ax * vy - ay * vx
+            if ki > 0:
+                ix, iy, iz = ix + ki * ex * dt, iy + ki * ey * dt, iz + ki * ez * dt
+                gx, gy, gz = gx + ix, gy + iy, gz + iz
+            gx, gy, gz = (gx + kp * ex) * 0.5 * dt, (gy + kp * ey) * 0.5 * dt, (gz + kp * ez) * 0.5 * dt
+            w, x, y, z = (w - x * gx - y * gy - z * gz,
+                          x + w * gx + y * gz - z * gy,
+                          y + w * gy - x * gz + z * gx,
+                          z + w * gz + x * gy - y * gx)
+            norm = 1 / math.sqrt(w * w + x * x + y * y + z * z)
+            w, x, y, z = w * norm, x * norm, y * norm, z * norm
+            result[j, i, 0], result[j, i, 1], result[j, i, 2], result[j, i, 3] = w, x, y, z
+
+@compile_kernel
+def complementary_kernel(accel, gyro, dt, alpha, q0, result):
+    for j in range(accel.shape[0]):
+        w, x, y, z = q0[j, 0], q0[j, 1], q0[j, 2], q0[j, 3]
+        for i in range(accel.shape[1]):
+            gx, gy, gz = gyro[j, i, 0] * 0.5 * dt, gyro[j, i, 1] * 0.5 * dt, gyro[j, i, 2] * 0.5 * dt
+            w, x, y, z = (w - x * gx - y * gy - z * gz,
+                          x + w * gx + y * gz - z * gy,
+                          y + w * gy - x * gz + z * gx,
+                          z + w * gz + x * gy - y * gx)
+            # tilt from the accelerometer, heading kept from the integrated gyro
+            ax, ay, az = accel[j, i, 0], accel[j, i, 1], accel[j, i, 2]
+            roll = math.atan2(ay, az)
+            pitch = math.atan2(-ax, math.sqrt(ay * ay + az * az))
+            yaw = math.atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+            cr, sr = math.cos(roll / 2), math.sin(roll / 2)
+            cp, sp = math.cos(pitch / 2), math.sin(pitch / 2)
+            cy, sy = math.cos(yaw / 2), math.sin(yaw / 2)
+            aw = cr * cp * cy + sr * sp * sy
+            ax = sr * cp * cy - cr * sp * sy
+            ay = cr * sp * cy + sr * cp * sy
+            az = cr * cp * sy - sr * sp * cy
+            sign = -alpha if w * aw + x * ax + y * ay + z * az < 0 else alpha
+            w, x, y, z = ((1 - alpha) * w + sign * aw,
+                          (1 - alpha) * x + sign * ax,
+                          (1 - alpha) * y + sign * ay,
+                          (1 - alpha) * z + sign * az)
+            norm = 1 / math.sqrt(w * w + x * x + y * y + z * z)
+            w, x, y, z = w * norm, x * norm, y * norm, z * norm
+            result[j, i, 0], result[j, i, 1], result[j, i, 2], result[j, i, 3] = w, x, y, z
+
+def madgwick(accel, gyro, sample_rate, beta=DEFAULT_MADGWICK_BETA, q0=None):
+    accel, gyro = prepare_inputs(accel, gyro)
+    result = np.empty(accel.shape[:2] + (4,))
+    madgwick_kernel(accel, gyro, 1.0 / sample_rate, float(beta), initial_quaternion(len(accel), q0), result)
+    return result
+
+def mahony(accel, gyro, sample_rate, kp=DEFAULT_MAHONY_KP, ki=DEFAULT_MAHONY_KI, q0=None):
+    accel, gyro = prepare_inputs(accel, gyro)
+    result = np.empty(accel.shape[:2] + (4,))
+    mahony_kernel(accel, gyro, 1.0 / sample_rate, float(kp), float(ki), initial_quaternion(len(accel), q0), result)
+    return result
+
+def complementary(accel, gyro, sample_rate, alpha=DEFAULT_COMPLEMENTARY_ALPHA, q0=None):
+    accel, gyro = prepare_inputs(accel, gyro)
+    result = np.empty(accel.shape[:2] + (4,))
+    complementary_kernel(accel, gyro, 1.0 / sample_rate, float(alpha), initial_quaternion(len(accel), q0), result)
+    return result
+
+FILTERS = {
+    'madgwick': madgwick,
+    'mahony': mahony,
+    'complementary': complementary
+}
+
+def quaternion_to_euler(q):
+    w, x, y, z = np.moveaxis(np.asarray(q), -1, 0)
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2 * (w * y - z * x), -1, 1))
+    yaw = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return np.degrees(np.stack([roll, pitch, yaw], axis=-1))
+
+def estimate_orientation(accel, gyro, sample_rate, method='madgwick', **params):
+    if method not in FILTERS:
+        raise ValueError(f'Unknown orientation filter \'{method}\'')
+    return FILTERS[method](accel, gyro, sample_rate, **params)
+
+def load_sensor_data(session_dir, session_info, sensor_ids, source):
+    if source == 'raw':
+        return SessionReader(session_dir).read(sensor_ids)
+    elif source == 'decoded':
+        return {sensor_id: read_decoded(session_dir, session_info, sensor_id) for sensor_id in sensor_ids}
+    raise ValueError(f'Unknown data source \'{source}\'')
+
+def estimate_session_orientation(session_dir, method='madgwick', sensor_ids=None, source='raw', euler=False, **params):
+    session_info = load_session_info(session_dir)
+    if sensor_ids is None:
+        sensor_ids = list(session_info['sensors'].keys())
+    data = load_sensor_data(session_dir, session_info, sensor_ids, source)
+    groups = {}
+    for sensor_id in sensor_ids:
+        columns = data[sensor_id].columns
+        if not all(column in columns for column in ACCEL_COLUMNS + GYRO_COLUMNS):
+            raise ValueError(f'Sensor \'{sensor_id}\' has no accel or gyro data in FIFO')
+        key = (session_info['sensors'][sensor_id]['sample_rate'], len(data[sensor_id]))
+        groups.setdefault(key, []).append(sensor_id)
+    result = {}
+    for (sample_rate, n_samples), group in groups.items():
+        accel = np.stack([data[sensor_id][ACCEL_COLUMNS].to_numpy() for sensor_id in group])
+        gyro = np.stack([data[sensor_id][GYRO_COLUMNS].to_numpy() for sensor_id in group])
+        quaternions = estimate_orientation(accel, gyro, sample_rate, method, **params)
+        index = pd.Index(np.arange(n_samples) / sample_rate, name='time')
+        for sensor_id, q in zip(group, quaternions):
+            df = pd.DataFrame(q, columns=QUATERNION_COLUMNS, index=index)
+            if euler:
+                df[EULER_COLUMNS] = quaternion_to_euler(q)
+            result[sensor_id] = df
+    return result
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+import yaml
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+METADATA_KEY = 'session_metadata'
+
+class CsvWriter:
+    def __init__(self, file_path, columns, n_rows, metadata):
+        self.columns = columns
+        self.header = True
+        self.file = open(file_path, 'w', newline='')
+
+    def write(self, data):
+        pd.DataFrame(data, columns=self.columns).to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+class NpzWriter:
+    def __init__(self, file_path, columns, n_rows, metadata):
+        self.zip = zipfile.ZipFile(file_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        with self.zip.open('columns.npy', 'w') as f:
+            np.lib.format.write_array(f, np.array(columns))
+        with self.zip.open('metadata.npy', 'w') as f:
+            np.lib.format.write_array(f, np.array(yaml.dump(metadata, sort_keys=False)))
+        self.file = self.zip.open('data.npy', 'w', force_zip64=True)
+        header = {'descr': np.lib.format.dtype_to_descr(np.dtype('<f4')),
+                  'fortran_order': False,
+                  'shape': (n_rows, len(columns))}
+        np.lib.format.write_array_header_2_0(self.file, header)
+
+    def write(self, data):
+        self.file.write(data.astype('<f4').tobytes())
+
+    def close(self):
+        self.file.close()
+        self.zip.close()
+
+class ParquetWriter:
+    def __init__(self, file_path, columns, n_rows, metadata):
+        self.schema = arrow_schema(columns, metadata)
+        self.writer = pa.parquet.ParquetWriter(file_path, self.schema)
+
+    def write(self, data):
+        self.writer.write_table(arrow_table(data, self.schema))
+
+    def close(self):
+        self.writer.close()
+
+class FeatherWriter:
+    def __init__(self, file_path, columns, n_rows, metadata):
+        self.schema = arrow_schema(columns, metadata)
+        self.sink = pa.OSFile(file_path, 'wb')
+        options = pa.ipc.IpcWriteOptions(compression='lz4')
+        self.writer = pa.ipc.new_file(self.sink, self.schema, options=options)
+
+    def write(self, data):
+        self.writer.write_table(arrow_table(data, self.schema))
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+class Hdf5Writer:
+    def __init__(self, file_path, columns, n_rows, metadata):
+        self.file = h5py.File(file_path, 'w')
+        self.file.attrs[METADATA_KEY] = yaml.dump(metadata, sort_keys=False)
+        self.datasets = [self.file.create_dataset(column, shape=(n_rows,), dtype='<f4') for column in columns]
+        self.row = 0
+
+    def write(self, data):
+        for i, dataset in enumerate(self.datasets):
+            dataset[self.row : self.row + len(data)] = data[:, i]
+        self.row += len(data)
+
+    def close(self):
+        self.file.close()
+
+def arrow_schema(columns, metadata):
+    fields = [pa.field(column, pa.float32()) for column in columns]
+    return pa.schema(fields, metadata={METADATA_KEY: yaml.dump(metadata, sort_keys=False)})
+
+def arrow_table(data, schema):
+    arrays = [pa.array(data[:, i].astype(np.float32)) for i in range(len(schema))]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def read_csv(file_path):
+    return pd.read_csv(file_path), None
+
+def read_npz(file_path):
+    with np.load(file_path) as npz:
+        df = pd.DataFrame(npz['data'], columns=list(npz['columns']))
+        metadata = yaml.safe_load(str(npz['metadata']))
+    return df, metadata
+
+def read_arrow_table(table):
+    metadata = yaml.safe_load(table.schema.metadata[METADATA_KEY.encode()])
+    return table.to_pandas(), metadata
+
+def read_parquet(file_path):
+    return read_arrow_table(pa.parquet.read_table(file_path))
+
+def read_feather(file_path):
+    return read_arrow_table(pa.feather.read_table(file_path))
+
+def read_hdf5(file_path):
+    with h5py.File(file_path, 'r') as f:
+        metadata = yaml.safe_load(f.attrs[METADATA_KEY])
+        df = pd.DataFrame({column: f[column][:] for column in metadata['columns']})
+    return df, metadata
+
+OUTPUT_FORMATS = {
+    'csv':     {'extension': 'csv',     'writer': CsvWriter,     'reader': read_csv,     'available': True},
+    'npz':     {'extension': 'npz',     'writer': NpzWriter,     'reader': read_npz,     'available': True},
+    'parquet': {'extension': 'parquet', 'writer': ParquetWriter, 'reader': read_parquet, 'available': pa is not None},
+    'feather': {'extension': 'feather', 'writer': FeatherWriter, 'reader': read_feather, 'available': pa is not None},
+    'hdf5':    {'extension': 'h5',      'writer': Hdf5Writer,    'reader': read_hdf5,    'available': h5py is not None}
+}
+
+def available_formats():
+    return [name for name, output_format in OUTPUT_FORMATS.items() if output_format['available']]
+
+def get_output_format(name):
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format \'{name}\'')
+    if not OUTPUT_FORMATS[name]['available']:
+        raise ValueError(f'Output format \'{name}\' is not available, install its library first')
+    return OUTPUT_FORMATS[name]
+
+def get_output_path(session_dir, file_name, name):
+    return os.path.join(session_dir, f'{file_name}.{OUTPUT_FORMATS[name]["extension"]}')
+
+def find_output(session_dir, file_name):
+    for name in OUTPUT_FORMATS:
+        file_path = get_output_path(session_dir, file_name, name)
+        if os.path.isfile(file_path):
+            return name, file_path
+    return None, None
+
+def read_output(file_path, name):
+    return get_output_format(name)['reader'](file_path)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+from session_processor import PART_SUFFIX, merge_session, decode_session, load_session_info, get_stale_sensors
+
+MANIFEST_NAME = 'ingest.yml'
+
+def get_manifest_path(session_dir):
+    return os.path.join(session_dir, 'metadata', MANIFEST_NAME)
+
+def save_manifest(session_dir, controllers):
+    os.makedirs(os.path.join(session_dir, 'metadata'), exist_ok=True)
+    with open(get_manifest_path(session_dir), 'w') as f:
+        yaml.dump({'controllers': list(controllers)}, f, sort_keys=False)
+
+def get_expected_controllers(session_dir, registry):
+    # Controllers named when the session was started, otherwise every controller in the registry
+    manifest_path = get_manifest_path(session_dir)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return yaml.safe_load(f)['controllers']
+    return list(registry)
+
+def get_received_controllers(session_dir):
+    metadata_path = os.path.join(session_dir, 'metadata')
+    if not os.path.isdir(metadata_path):
+        return []
+    return sorted(file_name[:-len(PART_SUFFIX)] for file_name in os.listdir(metadata_path)
+                  if file_name.endswith(PART_SUFFIX))
+
+def is_merged(session_dir):
+    return os.path.isfile(os.path.join(session_dir, 'metadata', 'session_info.yml'))
+
+def ingest_session(session_dir, chunk_size, workers, output_format):
+    if not is_merged(session_dir):
+        merge_session(session_dir)
+    decode_session(session_dir, chunk_size, workers, output_format)
+
+class SessionIngestor:
+    # Merges and decodes a session in a worker process once the parts of all expected controllers have arrived,
+    # so uploads keep being served while a session is processed: waiting -> queued -> running -> done/failed
+    def __init__(self, workers=1, registry=()):
+        self.registry = registry
+        # spawned, a forked worker would inherit the server socket and keep the port bound after the server exits
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        # reentrant, a job that ends before add_done_callback runs calls finish from inside add_part
+        self.lock = threading.RLock()
+        self.jobs = {}
+
+    def set_state(self, job, state, error=None):
+        job['state'] = state
+        job['since'] = time.time()
+        job['error'] = error
+
+    def add_part(self, session_dir, decode_cfg):
+        with self.lock:
+            job = self.jobs.get(session_dir)
+            if job is not None and job['state'] in ('queued', 'done'):
+                return job
+            if job is None:
+                job = {'session_name': os.path.basename(session_dir), 'state': None, 'since': None, 'error': None}
+                self.jobs[session_dir] = job
+            job['expected'] = sorted(get_expected_controllers(session_dir, self.registry))
+            job['received'] = get_received_controllers(session_dir)
+            if is_merged(session_dir):
+                session_info = load_session_info(session_dir)
+                if not get_stale_sensors(session_dir, session_info, decode_cfg['output_format']):
+                    self.set_state(job, 'done')
+                    return job
+            elif not job['expected'] or set(job['expected']) - set(job['received']):
+                self.set_state(job, 'waiting')
+                return job
+            self.set_state(job, 'queued')
+            job['future'] = self.executor.submit(ingest_session, session_dir, decode_cfg['chunk_size'],
+                                                 decode_cfg['workers'], decode_cfg['output_format'])
+            job['future'].add_done_callback(lambda future: self.finish(job, future))
+            return job
+
+    def finish(self, job, future):
+        with self.lock:
+            if future.cancelled():
+                self.set_state(job, 'failed', 'Cancelled')
+                return
+            error = future.exception()
+            if error is None:
+                self.set_state(job, 'done')
+            else:
+                self.set_state(job, 'failed', str(error))
+
+    def recover(self, sessions_path, decode_cfg):
+        # Sessions started through site.py carry a manifest, unfinished ones are picked up again after a restart
+        if not os.path.isdir(sessions_path):
+            return
+        for session_name in sorted(os.listdir(sessions_path)):
+            session_dir = os.path.join(sessions_path, session_name)
+            if os.path.isfile(get_manifest_path(session_dir)):
+                self.add_part(session_dir, decode_cfg)
+
+    def get_status(self, session_dir):
+        with self.lock:
+            job = self.jobs.get(session_dir)
+            if job is None:
+                if not os.path.isdir(session_dir):
+                    return None
+                return {
+                    'session_name': os.path.basename(session_dir),
+                    'state': 'merged' if is_merged(session_dir) else 'waiting',
+                    'since': None,
+                    'error': None,
+                    'expected': sorted(get_expected_controllers(session_dir, self.registry)),
+                    'received': get_received_controllers(session_dir)
+                }
+            status = {key: value for key, value in job.items() if key != 'future'}
+            if status['state'] == 'queued' and job['future'].running():
+                status['state'] = 'running'
+            return status
+
+    def get_statuses(self):
+        return [self.get_status(session_dir) for session_dir in list(self.jobs)]
+
+    def shutdown(self):
+        # waits for the running job, queued ones are picked up by recover on the next start
+        self.executor.shutdown(wait=True, cancel_futures=True)
\ No newline at end of file
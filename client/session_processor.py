@@ -1,12 +1,42 @@
-import struct
+import fcntl
 import yaml
 import os
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
+from decode_cache import get_decode_params, get_fingerprint, is_current, load_record, save_record
+from output_formats import OUTPUT_FORMATS, find_output, get_output_format, get_output_path, read_output
+
+DEFAULT_CHUNK_SIZE = 65536
+ANCHOR_DTYPE = np.dtype([('time', '<f8'), ('count', '<u8')])
+MAX_RATE_ERROR = 1.25
+MERGE_LOCK_NAME = '.merge.lock'
+PART_SUFFIX = '_session_info.yml'
+
+@contextmanager
+def merge_lock(session_dir):
+    # site.py and the ingestor in app.py may merge the same session at once, flock is released even on a crash
+    with open(os.path.join(session_dir, 'metadata', MERGE_LOCK_NAME), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def has_parts(session_dir):
+    return any(file_name.endswith(PART_SUFFIX) for file_name in os.listdir(os.path.join(session_dir, 'metadata')))
 
 def merge_session(session_dir):
+    # parts are removed once merged, a merge that waited for the lock finds none and leaves the result as is
+    with merge_lock(session_dir):
+        if has_parts(session_dir):
+            merge_parts(session_dir)
+
+def merge_parts(session_dir):
     session_parts = []
     for file_name in os.listdir(os.path.join(session_dir, 'metadata')):
-        if file_name[-17: ] == '_session_info.yml':
+        if file_name.endswith(PART_SUFFIX):
             file_path = os.path.join(session_dir, 'metadata', file_name)
             with open(file_path, 'r') as f: 
                 session_parts.append(yaml.safe_load(f))
@@ -18,25 +48,66 @@ def merge_session(session_dir):
     session_info['time'] = {
         'start': dict(zip([part['controller_id'] for part in session_parts], 
                             [part['time']['start'] for part in session_parts])),
+        'start_skew': dict(zip([part['controller_id'] for part in session_parts],
+                               [part['time'].get('start_skew') for part in session_parts])),
         'duration': session_parts[0]['time']['duration']
     }
     session_info['sensors'] = {}
     session_info['overflows'] = {}
+    session_info['gaps'] = {}
     session_info['files'] = {}
+    session_info['anchors'] = {}
     session_info['n_packages'] = {}
     for part in session_parts:
         session_info['sensors'].update(part['sensors'])
         session_info['overflows'].update(part['overflows'])
+        session_info['gaps'].update(part.get('gaps', {}))
         session_info['files'].update(part['files'])
+        session_info['anchors'].update(part.get('anchors', {}))
         session_info['n_packages'].update(part['n_packages'])        
     session_info['crops'] = {}
-    start_time_max = max([part['time']['start'] for part in session_parts])
+    starts = {}
+    fits = {}
     for controller_id, sensor_ids in session_info['devices'].items():
-        delta_t = start_time_max - session_info['time']['start'][controller_id]
         for sensor_id in sensor_ids:
-            n = session_info['n_packages'][sensor_id]
-            delta_n = int(delta_t * session_info['sensors'][sensor_id]['sample_rate'])
+            starts[sensor_id] = session_info['time']['start'][controller_id]
+            anchors = load_anchors(session_dir, session_info, sensor_id)
+            resets = [gap for gap in session_info['gaps'].get(sensor_id) or [] if 'anchor' in gap]
+            fit = fit_anchors(anchors, session_info['sensors'][sensor_id]['sample_rate'], [gap['anchor'] for gap in resets])
+            if fit is not None:
+                fits[sensor_id] = fit
+                starts[sensor_id] = fit[1]
+                for gap, shift in zip(resets, fit[3]):
+                    gap['length'] = max(gap['length'] - shift, 0)
+    start_time_max = max(starts.values())
+    if fits:
+        session_info['alignment'] = {}
+    for sensor_id, start in starts.items():
+        n = get_timeline_length(session_info['n_packages'][sensor_id], get_gaps(session_info, sensor_id))
+        sample_rate = session_info['sensors'][sensor_id]['sample_rate']
+        if sensor_id in fits:
+            # resample onto the common timeline: output row k is timeline sample offset + k * step
+            rate, _, residuals, _ = fits[sensor_id]
+            offset = (start_time_max - start) * rate
+            step = rate / sample_rate
+            session_info['alignment'][sensor_id] = {
+                'rate': float(rate),
+                'drift_ppm': float((step - 1) * 1e6),
+                'offset': float(offset),
+                'step': float(step),
+                'rms_error': float(np.sqrt(np.mean(residuals ** 2))),
+                'max_error': float(np.max(np.abs(residuals)))
+            }
+            n_rows = max(int(np.floor((n - 1 - offset) / step)) + 1, 0)
+            session_info['crops'][sensor_id] = [int(offset), int(offset) + n_rows]
+        else:
+            delta_n = int((start_time_max - start) * sample_rate)
             session_info['crops'][sensor_id] = [delta_n, n]
+    if fits:
+        session_info['alignment_error'] = {
+            'rms': max(alignment['rms_error'] for alignment in session_info['alignment'].values()),
+            'max': max(alignment['max_error'] for alignment in session_info['alignment'].values())
+        }
     n_min = min([crop[1] - crop[0] for crop in session_info['crops'].values()])
     for sensor_id in session_info['sensors']:
         crop = session_info['crops'][sensor_id]
@@ -46,53 +117,345 @@ def merge_session(session_dir):
     with open(session_info_path, 'w') as f:
         yaml.dump(session_info, f, sort_keys=False)
     
-def decode_session(session_dir):
+def get_columns(sensor_info):
+    columns = []
+    if sensor_info['accel_fifo_enabled']:
+        columns += ['accel_x', 'accel_y', 'accel_z']
+    if sensor_info['x_gyro_fifo_enabled']:
+        columns.append('gyro_x')
+    if sensor_info['y_gyro_fifo_enabled']:
+        columns.append('gyro_y')
+    if sensor_info['z_gyro_fifo_enabled']:
+        columns.append('gyro_z')
+    return columns
+
+def get_factors(sensor_info):
+    factors = []
+    if sensor_info['accel_fifo_enabled']:
+        factors += [sensor_info['accel_factor']] * 3
+    if sensor_info['x_gyro_fifo_enabled']:
+        factors.append(sensor_info['gyro_factor'])
+    if sensor_info['y_gyro_fifo_enabled']:
+        factors.append(sensor_info['gyro_factor'])
+    if sensor_info['z_gyro_fifo_enabled']:
+        factors.append(sensor_info['gyro_factor'])
+    return np.array(factors, dtype=np.float64)
+
+def decode_packages(buffer, sensor_info):
+    package_length = sensor_info['package_length']
+    factors = get_factors(sensor_info)
+    if package_length == 0:
+        return np.empty((0, len(factors)), dtype=np.float64)
+    data = np.frombuffer(buffer, dtype='>i2', count=len(buffer) // package_length * package_length // 2)
+    data = data.reshape(-1, package_length // 2)
+    return data[:, :len(factors)] * factors
+
+def get_gaps(session_info, sensor_id):
+    gaps = session_info.get('gaps', {}).get(sensor_id) or []
+    return [(gap['package'], gap['length']) for gap in gaps]
+
+def get_timeline_length(n_raw, gaps):
+    return n_raw + sum(length for package, length in gaps if package <= n_raw)
+
+def iter_timeline(gaps, first, last):
+    # Maps timeline samples [first, last) to (raw_start, raw_stop) package ranges and (None, length) gaps
+    position, raw = 0, 0
+    for package, length in gaps:
+        data_stop = position + package - raw
+        start, stop = max(first, position), min(last, data_stop)
+        if start < stop:
+            yield raw + start - position, raw + stop - position
+        start, stop = max(first, data_stop), min(last, data_stop + length)
+        if start < stop:
+            yield None, stop - start
+        position, raw = data_stop + length, package
+    start = max(first, position)
+    if start < last:
+        yield raw + start - position, raw + last - position
+
+def load_anchors(session_dir, session_info, sensor_id):
+    file_name = session_info.get('anchors', {}).get(sensor_id)
+    if file_name is None:
+        return None
+    file_path = os.path.join(session_dir, 'raw_data', file_name)
+    if not os.path.isfile(file_path):
+        return None
+    return np.fromfile(file_path, dtype=ANCHOR_DTYPE)
+
+def fit_anchors(anchors, sample_rate, breaks=()):
+    # Least squares fit of samples produced against host time, returns (rate, time of sample 0, residuals in seconds,
+    # gap length corrections). breaks are the anchor indices at which a FIFO reset added a gap of estimated length
+    if anchors is None or len(anchors) < 2 or anchors['time'][-1] <= anchors['time'][0]:
+        return None
+    time = anchors['time'] - anchors['time'][0]
+    count = anchors['count'].astype(np.float64)
+    shifts = np.zeros(len(breaks), dtype=np.int64)
+    if len(breaks):
+        # every segment between resets gets its own intercept, their steps are the errors of the estimated gap lengths
+        segments = np.searchsorted(np.asarray(breaks), np.arange(len(anchors)), side='right')
+        design = np.column_stack([time, np.eye(len(breaks) + 1)[segments]])
+        solution, _, rank, _ = np.linalg.lstsq(design, count, rcond=None)
+        if rank < design.shape[1]:
+            return None
+        shifts = np.round(np.diff(solution[1:])).astype(np.int64)
+        count -= np.concatenate([[0], np.cumsum(shifts)])[segments]
+    rate, intercept = np.polyfit(time, count, 1)
+    if not sample_rate / MAX_RATE_ERROR < rate < sample_rate * MAX_RATE_ERROR:
+        return None
+    residuals = (count - rate * time - intercept) / rate
+    # a count read at host time t includes the sample in progress, half a sample late on average
+    start = anchors['time'][0] - (intercept - 0.5) / rate
+    return rate, start, residuals, [int(shift) for shift in shifts]
+
+def get_alignment(session_info, sensor_id):
+    return session_info.get('alignment', {}).get(sensor_id)
+
+def open_raw_data(source_file_path, package_length):
+    n_raw = os.path.getsize(source_file_path) // package_length if package_length else 0
+    if n_raw == 0:
+        return None
+    return np.memmap(source_file_path, dtype=np.uint8, mode='r', shape=(n_raw * package_length,))
+
+def read_timeline(raw_data, sensor_info, gaps, first, last):
+    package_length = sensor_info['package_length']
+    n_raw = len(raw_data) // package_length if raw_data is not None else 0
+    chunks = [decode_packages(b'', sensor_info)]
+    for raw_start, raw_stop in iter_timeline(gaps, first, min(last, get_timeline_length(n_raw, gaps))):
+        if raw_start is None:
+            chunks.append(np.full((raw_stop, chunks[0].shape[1]), np.nan))
+        else:
+            chunks.append(decode_packages(raw_data[raw_start * package_length : raw_stop * package_length], sensor_info))
+    return chunks[-1] if len(chunks) <= 2 else np.concatenate(chunks)
+
+def read_rows(raw_data, sensor_info, gaps, crop, alignment, start, stop):
+    if alignment is None:
+        return read_timeline(raw_data, sensor_info, gaps, crop[0] + start, crop[0] + stop)
+    if stop <= start:
+        return decode_packages(b'', sensor_info)
+    positions = np.maximum(alignment['offset'] + np.arange(start, stop) * alignment['step'], 0)
+    lower = np.floor(positions)
+    first = int(lower[0])
+    data = read_timeline(raw_data, sensor_info, gaps, first, int(lower[-1]) + 2)
+    index = (lower - first).astype(np.int64)
+    upper = np.minimum(index + 1, len(data) - 1)
+    return data[index] + (data[upper] - data[index]) * (positions - lower)[:, np.newaxis]
+
+def count_packages(source_file_path, sensor_info, crop, gaps=(), alignment=None):
+    package_length = sensor_info['package_length']
+    n_packages = crop[1] - crop[0]
+    if package_length:
+        n_timeline = get_timeline_length(os.path.getsize(source_file_path) // package_length, gaps)
+        if alignment is None:
+            n_packages = min(n_packages, n_timeline - crop[0])
+        else:
+            n_packages = min(n_packages, int(np.floor((n_timeline - 1 - alignment['offset']) / alignment['step'])) + 1)
+    return max(n_packages, 0)
+
+def iter_decoded_chunks(source_file_path, sensor_info, crop, chunk_size=DEFAULT_CHUNK_SIZE, gaps=(), alignment=None):
+    n_packages = count_packages(source_file_path, sensor_info, crop, gaps, alignment)
+    if n_packages == 0:
+        yield decode_packages(b'', sensor_info)
+        return
+    raw_data = open_raw_data(source_file_path, sensor_info['package_length'])
+    if not chunk_size:
+        chunk_size = n_packages
+    for start in range(0, n_packages, chunk_size):
+        yield read_rows(raw_data, sensor_info, gaps, crop, alignment, start, min(start + chunk_size, n_packages))
+    del raw_data
+
+def get_output_gaps(gaps, crop, alignment, n_rows):
+    # Gap positions as [row, length] in the decoded output, resampled rows touching a gap are NaN too
+    output_gaps = []
+    position, raw = 0, 0
+    for package, length in gaps:
+        start = position + package - raw
+        position, raw = start + length, package
+        if length == 0:
+            continue
+        if alignment is None:
+            first, last = start - crop[0], position - crop[0]
+        else:
+            first = int(np.ceil((start - 1 - alignment['offset']) / alignment['step']))
+            last = int(np.ceil((position - alignment['offset']) / alignment['step']))
+        first, last = max(first, 0), min(last, n_rows)
+        if first < last:
+            output_gaps.append([first, last - first])
+    return output_gaps
+
+def decode_sensor(session_dir, session_info, sensor_id, chunk_size=DEFAULT_CHUNK_SIZE, output_format='csv'):
+    sensor_info = session_info['sensors'][sensor_id]
+    file_name = session_info['files'][sensor_id]
+    crop = session_info['crops'][sensor_id]
+    gaps = get_gaps(session_info, sensor_id)
+    alignment = get_alignment(session_info, sensor_id)
+    source_file_path = os.path.join(session_dir, 'raw_data', file_name)
+    target_file_path = get_output_path(session_dir, file_name, output_format)
+    columns = get_columns(sensor_info)
+    metadata = {
+        'session': session_info['name'],
+        'sensor_id': sensor_id,
+        'columns': columns,
+        'crop': crop,
+        'sensor': sensor_info
+    }
+    if alignment is not None:
+        metadata['alignment'] = alignment
+    n_rows = count_packages(source_file_path, sensor_info, crop, gaps, alignment)
+    if gaps:
+        metadata['gaps'] = get_output_gaps(gaps, crop, alignment, n_rows)
+    # per process, a decode started from site.py may overlap with the ingestor decoding the same sensor
+    part_file_path = f'{target_file_path}.{os.getpid()}.part'
+    with merge_lock(session_dir):
+        remove_stale_parts(session_dir, file_name)
+    writer = get_output_format(output_format)['writer'](part_file_path, columns, n_rows, metadata)
+    try:
+        for data in iter_decoded_chunks(source_file_path, sensor_info, crop, chunk_size, gaps, alignment):
+            writer.write(data)
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(part_file_path)
+        raise
+    with merge_lock(session_dir):
+        os.replace(part_file_path, target_file_path)
+        record = load_record(session_dir, sensor_id)
+        save_record(session_dir, sensor_id, {
+            'source': get_fingerprint(source_file_path),
+            'params': get_decode_params(session_info, sensor_id, output_format),
+            'output': {
+                'file_name': os.path.basename(target_file_path),
+                'size': os.path.getsize(target_file_path)
+            }
+        })
+        # a decode to another format replaces the record, its output would be left behind
+        if record is not None and record['output']['file_name'] != os.path.basename(target_file_path):
+            old_file_path = os.path.join(session_dir, record['output']['file_name'])
+            if os.path.isfile(old_file_path):
+                os.remove(old_file_path)
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def remove_stale_parts(session_dir, file_name):
+    # part files are named {output}.{pid}.part, those of a killed decode are never replaced by a later one
+    extensions = [output_format['extension'] for output_format in OUTPUT_FORMATS.values()]
+    for part_name in os.listdir(session_dir):
+        if not part_name.startswith(f'{file_name}.'):
+            continue
+        suffix = part_name[len(file_name) + 1:].split('.')
+        if len(suffix) != 3 or suffix[0] not in extensions or not suffix[1].isdigit() or suffix[2] != 'part':
+            continue
+        pid = int(suffix[1])
+        if pid == os.getpid() or not is_running(pid):
+            os.remove(os.path.join(session_dir, part_name))
+
+def find_decoded(session_dir, session_info, sensor_id):
+    record = load_record(session_dir, sensor_id)
+    if record is None:
+        return find_output(session_dir, session_info['files'][sensor_id])
+    if not is_current(session_dir, session_info, sensor_id):
+        return None, None
+    return record['params']['output_format'], os.path.join(session_dir, record['output']['file_name'])
+
+def read_decoded(session_dir, session_info, sensor_id):
+    output_format, file_path = find_decoded(session_dir, session_info, sensor_id)
+    if output_format is None:
+        raise FileNotFoundError(f'Sensor \'{sensor_id}\' is not decoded')
+    return read_output(file_path, output_format)[0]
+
+def is_decoded(session_dir, session_info):
+    for sensor_id in session_info['sensors']:
+        if load_record(session_dir, sensor_id) is not None:
+            if not is_current(session_dir, session_info, sensor_id):
+                return False
+        elif find_output(session_dir, session_info['files'][sensor_id])[0] is None:
+            return False
+    return True
+
+def get_stale_sensors(session_dir, session_info, output_format='csv'):
+    return [sensor_id for sensor_id in session_info['sensors']
+            if not is_current(session_dir, session_info, sensor_id, output_format)]
+
+class SessionReader:
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self.session_info = load_session_info(session_dir)
+
+    @property
+    def sensor_ids(self):
+        return list(self.session_info['sensors'].keys())
+
+    def get_source_path(self, sensor_id):
+        return os.path.join(self.session_dir, 'raw_data', self.session_info['files'][sensor_id])
+
+    def get_n_packages(self, sensor_id):
+        sensor_info = self.session_info['sensors'][sensor_id]
+        crop = self.session_info['crops'][sensor_id]
+        return count_packages(self.get_source_path(sensor_id), sensor_info, crop, get_gaps(self.session_info, sensor_id),
+                              get_alignment(self.session_info, sensor_id))
+
+    def get_duration(self, sensor_id):
+        return self.get_n_packages(sensor_id) / self.session_info['sensors'][sensor_id]['sample_rate']
+
+    def read_sensor(self, sensor_id, start=None, stop=None):
+        sensor_info = self.session_info['sensors'][sensor_id]
+        package_length = sensor_info['package_length']
+        sample_rate = sensor_info['sample_rate']
+        crop = self.session_info['crops'][sensor_id]
+        n_packages = self.get_n_packages(sensor_id)
+        first = 0 if start is None else min(max(int(np.ceil(start * sample_rate)), 0), n_packages)
+        last = n_packages if stop is None else min(max(int(np.ceil(stop * sample_rate)), first), n_packages)
+        raw_data = open_raw_data(self.get_source_path(sensor_id), package_length)
+        data = read_rows(raw_data, sensor_info, get_gaps(self.session_info, sensor_id), crop,
+                         get_alignment(self.session_info, sensor_id), first, last)
+        del raw_data
+        df = pd.DataFrame(data, columns=get_columns(sensor_info))
+        df.index = pd.Index(np.arange(first, first + len(df)) / sample_rate, name='time')
+        return df
+
+    def read(self, sensor_ids=None, start=None, stop=None):
+        if sensor_ids is None:
+            sensor_ids = self.sensor_ids
+        return {sensor_id: self.read_sensor(sensor_id, start, stop) for sensor_id in sensor_ids}
+
+def run_parallel(function, args_list, workers=1):
+    if not workers or workers <= 1 or len(args_list) <= 1:
+        return [function(*args) for args in args_list]
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(args_list)))
+    try:
+        futures = [executor.submit(function, *args) for args in args_list]
+        for future in as_completed(futures):
+            future.result()
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def load_session_info(session_dir):
     session_info_path = os.path.join(session_dir, 'metadata', 'session_info.yml')
     with open(session_info_path, 'r') as f: 
-        session_info = yaml.safe_load(f)
-    file_names = session_info['files']
-    source_file_paths = list(map(lambda x:  os.path.join(session_dir, 'raw_data', x), file_names.values()))
-    target_file_paths = list(map(lambda x:  os.path.join(session_dir, f'{x}.csv'), file_names.values()))
-    for i, sensor_id in enumerate(session_info['sensors']):
-        package_length = session_info['sensors'][sensor_id]['package_length']
-        accel_factor = session_info['sensors'][sensor_id]['accel_factor']
-        gyro_factor = session_info['sensors'][sensor_id]['gyro_factor']
-        accel_fifo_enabled = session_info['sensors'][sensor_id]['accel_fifo_enabled']
-        x_gyro_fifo_enabled = session_info['sensors'][sensor_id]['x_gyro_fifo_enabled']
-        y_gyro_fifo_enabled = session_info['sensors'][sensor_id]['y_gyro_fifo_enabled']
-        z_gyro_fifo_enabled = session_info['sensors'][sensor_id]['z_gyro_fifo_enabled']
-        crop = session_info['crops'][sensor_id]
-        df = []
-        with open(source_file_paths[i], 'rb') as f:
-            data = list(f.read())
-            for j in range(crop[0], crop[1]):
-                package = data[j * package_length :  (j + 1) * package_length]
-                package_format = '>' + 'h' * (package_length // 2)
-                package = struct.unpack(package_format, memoryview(bytearray(package)))
-                readings = []
-                p = 0
-                if accel_fifo_enabled: 
-                    readings.append(package[0] * accel_factor)
-                    readings.append(package[1] * accel_factor)
-                    readings.append(package[2] * accel_factor)
-                    p = 3
-                if x_gyro_fifo_enabled: 
-                    readings.append(package[p] * gyro_factor)
-                    p += 1
-                if y_gyro_fifo_enabled: 
-                    readings.append(package[p] * gyro_factor)
-                    p += 1
-                if z_gyro_fifo_enabled: 
-                    readings.append(package[p] * gyro_factor)
-                df.append(readings)
-        columns = []
-        if accel_fifo_enabled:
-            columns += ['accel_x', 'accel_y', 'accel_z']
-        if x_gyro_fifo_enabled: 
-            columns.append('gyro_x')
-        if y_gyro_fifo_enabled: 
-            columns.append('gyro_y')
-        if z_gyro_fifo_enabled: 
-            columns.append('gyro_z')
-        df = pd.DataFrame(df, columns=columns)
-        df.to_csv(target_file_paths[i], index=False)
\ No newline at end of file
+        return yaml.safe_load(f)
+
+def decode_session(session_dir, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, output_format='csv', force=False):
+    decode_sessions([session_dir], chunk_size, workers, output_format, force)
+
+def decode_sessions(session_dirs, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, output_format='csv', force=False):
+    get_output_format(output_format)
+    args_list = []
+    for session_dir in session_dirs:
+        session_info = load_session_info(session_dir)
+        if force:
+            sensor_ids = list(session_info['sensors'].keys())
+        else:
+            sensor_ids = get_stale_sensors(session_dir, session_info, output_format)
+        for sensor_id in sensor_ids:
+            args_list.append((session_dir, session_info, sensor_id, chunk_size, output_format))
+    run_parallel(decode_sensor, args_list, workers)
+
+def merge_sessions(session_dirs, workers=1):
+    run_parallel(merge_session, [(session_dir,) for session_dir in session_dirs], workers)
\ No newline at end of file
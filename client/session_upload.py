@@ -0,0 +1,69 @@
+import hashlib
+import os
+import zipfile
+
+UPLOAD_DIRS = ['raw_data', 'metadata']
+CHECKSUM_BLOCK_SIZE = 1 << 20
+
+def get_session_dir(sessions_path, session_name):
+    if not session_name or session_name in ('.', '..') or os.path.basename(session_name) != session_name:
+        raise ValueError(f'Invalid session name \'{session_name}\'')
+    return os.path.join(sessions_path, session_name)
+
+def get_upload_path(session_dir, path):
+    parts = path.split('/')
+    if len(parts) != 2 or parts[0] not in UPLOAD_DIRS or parts[1] in ('', '.', '..') or '\\' in parts[1]:
+        raise ValueError(f'Invalid upload path \'{path}\'')
+    return os.path.join(session_dir, *parts)
+
+def extract_archive(file, session_dir):
+    # zipfile strips absolute paths and '..' components, so members stay inside session_dir
+    os.makedirs(session_dir, exist_ok=True)
+    with zipfile.ZipFile(file, 'r') as archive:
+        archive.extractall(session_dir)
+
+def get_checksum(file_path):
+    checksum = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_SIZE), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+def get_file_sizes(session_dir):
+    # Offsets acknowledged so far, a manager resumes each file from here after a failed request or a restart
+    sizes = {}
+    for dir_name in UPLOAD_DIRS:
+        dir_path = os.path.join(session_dir, dir_name)
+        if os.path.isdir(dir_path):
+            for file_name in os.listdir(dir_path):
+                sizes[f'{dir_name}/{file_name}'] = os.path.getsize(os.path.join(dir_path, file_name))
+    return sizes
+
+def write_chunk(session_dir, path, offset, data, checksum=None):
+    # Chunks arrive in order from one manager, a retried chunk overwrites its own bytes
+    if checksum is not None and hashlib.sha256(data).hexdigest() != checksum:
+        raise ValueError(f'Checksum mismatch in chunk at offset {offset} of \'{path}\'')
+    file_path = get_upload_path(session_dir, path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    size = os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+    if offset > size:
+        raise ValueError(f'Chunk at offset {offset} leaves a hole in \'{path}\' of {size} bytes')
+    with open(file_path, 'r+b' if os.path.isfile(file_path) else 'wb') as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+    return offset + len(data)
+
+def verify_files(session_dir, files):
+    # A short file is resumed by the manager, a longer file or one with the wrong content is truncated and sent again
+    mismatched = []
+    for path, expected in files.items():
+        file_path = get_upload_path(session_dir, path)
+        size = os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+        if size < expected['size']:
+            mismatched.append(path)
+        elif size > expected['size'] or get_checksum(file_path) != expected['sha256']:
+            mismatched.append(path)
+            with open(file_path, 'r+b') as f:
+                f.truncate(0)
+    return mismatched
\ No newline at end of file
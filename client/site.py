@@ -6,8 +6,10 @@ import yaml
 import shutil
 import os
 import socket
+import time
 from datetime import datetime
-from session_processor import merge_session, decode_session
+from session_processor import merge_session, decode_session, is_decoded
+from session_ingest import save_manifest, get_manifest_path, get_expected_controllers, get_received_controllers
 
 #MPU6050 Constants
 DLPF_ENUM = {
@@ -58,6 +60,11 @@ max_session_duration = cfg['max_session_duration']
 refresh_interval     = cfg['refresh_interval']
 topic_control        = cfg['mqtt']['topic']['control']
 topic_info           = cfg['mqtt']['topic']['info']
+decode_chunk_size    = cfg['decode']['chunk_size']
+decode_workers       = cfg['decode']['workers']
+decode_format        = cfg['decode']['output_format']
+start_lead           = cfg['start_lead']
+ingest_controllers   = cfg['ingest']['controllers']
 
 def update_config():
     cfg['path']['sessions_path'] = st.session_state.sessions_path
@@ -165,11 +172,7 @@ if session_name:
         if os.path.isfile(session_info_path):
             with open(session_info_path, 'r') as f:
                 info = yaml.safe_load(f)
-            check = True
-            for file_name in info['files'].values():
-                if not os.path.isfile(os.path.join(session_dir, f'{file_name}.csv')):
-                    check = False
-                    break
+            check = is_decoded(session_dir, info)
             if check:
                 st.success('Session is merged and decoded')
             else:
@@ -190,17 +193,24 @@ if session_name:
                             st.write('- ' + sensor)
             if not check:
                 if st.button("Decode session"):
-                    decode_session(session_dir)
+                    decode_session(session_dir, decode_chunk_size, decode_workers, decode_format)
                     st.experimental_rerun()
         else:
             st.info('Session parts aren\'t merged')
-            if st.button("Merge session parts"):
-                merge_session(session_dir)
-                st.experimental_rerun()
-            if st.button("Merge and decode"):
-                merge_session(session_dir)
-                decode_session(session_dir)
-                st.experimental_rerun()
+            # app.py merges and decodes on its own once the last expected part is uploaded
+            expected = get_expected_controllers(session_dir, ingest_controllers)
+            received = get_received_controllers(session_dir)
+            st.write(f'Received parts: {len(received)} of {len(expected)}')
+            if os.path.isfile(get_manifest_path(session_dir)) and expected and not set(expected) - set(received):
+                st.info('All parts received, the session is being merged and decoded')
+            else:
+                if st.button("Merge session parts"):
+                    merge_session(session_dir)
+                    st.experimental_rerun()
+                if st.button("Merge and decode"):
+                    merge_session(session_dir)
+                    decode_session(session_dir, decode_chunk_size, decode_workers, decode_format)
+                    st.experimental_rerun()
 
         if st.button("Delete session"):
             shutil.rmtree(session_dir)
@@ -215,8 +225,11 @@ if session_name:
                 if duration:
                     if os.path.isdir(session_dir):
                         shutil.rmtree(session_dir)
+                    save_manifest(session_dir, ingest_controllers)
                     st.info('Session started. Please wait...')
-                    payload = {'command': 'start_session', 'args': {'session_name': session_name, 'duration' : duration} }
+                    # Managers pre-arm on receipt and start together at the scheduled epoch
+                    payload = {'command': 'start_session', 'args': {'session_name': session_name, 'duration' : duration,
+                                                                    'start_time': time.time() + start_lead} }
                     payload = yaml.dump(payload)
                     publish(client, topic_control, payload)
                 else:
@@ -235,6 +248,23 @@ if client.is_connected():
             publish(client, topic_control, payload)
             st.info(f"Command sended: Ping sensors")
 
+    with st.expander("Session control"):
+        if st.button("Session status"):
+            payload = {"command":"session_status"}
+            payload = yaml.dump(payload)
+            publish(client, topic_control, payload)
+            st.info(f"Command sended: Session status")
+        if st.button("Stop session"):
+            payload = {"command":"stop_session"}
+            payload = yaml.dump(payload)
+            publish(client, topic_control, payload)
+            st.info(f"Command sended: Stop session")
+        if st.button("Upload spool status"):
+            payload = {"command":"spool_status"}
+            payload = yaml.dump(payload)
+            publish(client, topic_control, payload)
+            st.info(f"Command sended: Upload spool status")
+
     with st.expander("Reset sensors"):
         sensor_id_reset = st.text_input("Sensor id", key='sensor_id_reset')
         if st.button("Reset sensor by id"):
@@ -347,4 +377,19 @@ if client.is_connected():
                 }
             payload = yaml.dump(payload)
             publish(client, topic_control, payload)
-            st.info('Command sended: Configurate all sensors')
\ No newline at end of file
+            st.info('Command sended: Configurate all sensors')
+
+    with st.expander("Configuration profiles"):
+        profile_name = st.text_input("Profile name", key='profile_name')
+        sensor_id_profile = st.text_input("Sensor id (empty for all sensors)", key='sensor_id_profile')
+        if st.button("Apply profile"):
+            if profile_name:
+                args = {'profile': profile_name}
+                if sensor_id_profile:
+                    args['sensor_id'] = sensor_id_profile
+                payload = {"command": "apply_profile", "args": args}
+                payload = yaml.dump(payload)
+                publish(client, topic_control, payload)
+                st.info(f'Command sended: Apply profile \'{profile_name}\'')
+            else:
+                st.error("Profile name must be specified!")
\ No newline at end of file
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from orientation import FILTERS, estimate_orientation, quaternion_to_euler
+
+SAMPLE_RATE = 100.0
+DURATION = 30.0
+SETTLE_TIME = 5.0
+YAW_RATE = 30.0
+TILTS = [(20.0, -10.0), (-35.0, 25.0)]
+MAX_TILT_ERROR = 1.5
+MAX_YAW_ERROR = 1.5
+
+def synthetic_rotation(roll, pitch, n_samples, rng):
+    # Static tilt while turning about the gravity axis: the body sees constant gravity and a constant rate
+    roll, pitch = np.radians(roll), np.radians(pitch)
+    down = np.array([-np.sin(pitch), np.cos(pitch) * np.sin(roll), np.cos(pitch) * np.cos(roll)])
+    accel = down + rng.normal(0, 0.01, (n_samples, 3))
+    gyro = YAW_RATE * down + rng.normal(0, 0.2, (n_samples, 3))
+    return accel, gyro
+
+def tilt_quaternion(roll, pitch):
+    roll, pitch = np.radians(roll) / 2, np.radians(pitch) / 2
+    return [np.cos(roll) * np.cos(pitch), np.sin(roll) * np.cos(pitch),
+            np.cos(roll) * np.sin(pitch), -np.sin(roll) * np.sin(pitch)]
+
+@pytest.mark.parametrize('method', list(FILTERS))
+def test_constant_rotation_about_gravity(method):
+    rng = np.random.default_rng(0)
+    n_samples = int(SAMPLE_RATE * DURATION)
+    data = [synthetic_rotation(roll, pitch, n_samples, rng) for roll, pitch in TILTS]
+    accel = np.stack([accel for accel, _ in data])
+    gyro = np.stack([gyro for _, gyro in data])
+    # yaw is not observable from gravity, so the filters start from the true heading
+    q0 = [tilt_quaternion(roll, pitch) for roll, pitch in TILTS]
+    quaternions = estimate_orientation(accel, gyro, SAMPLE_RATE, method, q0=q0)
+    assert quaternions.shape == (len(TILTS), n_samples, 4)
+    time = np.arange(n_samples) / SAMPLE_RATE
+    settled = time >= SETTLE_TIME
+    for (roll, pitch), q in zip(TILTS, quaternions):
+        euler = quaternion_to_euler(q)[settled]
+        yaw_error = (euler[:, 2] - YAW_RATE * time[settled] + 180) % 360 - 180
+        assert np.abs(euler[:, 0] - roll).max() < MAX_TILT_ERROR
+        assert np.abs(euler[:, 1] - pitch).max() < MAX_TILT_ERROR
+        assert np.abs(yaw_error).max() < MAX_YAW_ERROR
+
+def test_unknown_filter():
+    with pytest.raises(ValueError):
+        estimate_orientation(np.zeros((10, 3)), np.zeros((10, 3)), SAMPLE_RATE, 'kalman')
\ No newline at end of file
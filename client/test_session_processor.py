@@ -0,0 +1,230 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+import pytest
+import yaml
+from session_processor import (ANCHOR_DTYPE, SessionReader, count_packages, decode_session, fit_anchors,
+                               get_output_gaps, iter_decoded_chunks, load_session_info, merge_session)
+from output_formats import get_output_path
+
+N_PACKAGES = 1000
+# chunk_size 0 decodes in one shot and is the reference for the others
+CHUNK_SIZES = [0, 1, 7, 1 << 20]
+SAMPLE_RATE = 1000.0
+DRIFT_RATE = 1000.2
+DURATION = 10
+START_DELAY = 0.0105
+GAP = {'package': 3000, 'length': 250, 'estimate': 240}
+
+def get_sensor_info(accel=True, gyro=True):
+    return {
+        'clock_source': 1,
+        'dlpf_mode': 1,
+        'rate': 0,
+        'sample_rate': 1000.0,
+        'full_scale_accel_range': 0,
+        'full_scale_gyro_range': 0,
+        'accel_factor': 2 / 32768.0,
+        'gyro_factor': 250 / 32768.0,
+        'accel_fifo_enabled': accel,
+        'x_gyro_fifo_enabled': gyro,
+        'y_gyro_fifo_enabled': gyro,
+        'z_gyro_fifo_enabled': gyro,
+        'package_length': 6 * accel + 6 * gyro
+    }
+
+def create_session(session_dir):
+    # A plain sensor, a gyro-only sensor with recorded gaps and a resampled sensor with clock drift
+    os.makedirs(os.path.join(session_dir, 'metadata'))
+    os.makedirs(os.path.join(session_dir, 'raw_data'))
+    rng = np.random.default_rng(0)
+    sensors = {
+        'plain': get_sensor_info(),
+        'gaps': get_sensor_info(accel=False),
+        'drift': get_sensor_info()
+    }
+    session_info = {
+        'name': os.path.basename(session_dir),
+        'devices': {'test': list(sensors)},
+        'time': {'start': {'test': 0.0}, 'duration': N_PACKAGES / 1000.0},
+        'sensors': sensors,
+        'overflows': {sensor_id: [] for sensor_id in sensors},
+        'gaps': {'gaps': [{'package': 100, 'length': 13, 'time': 0.1}, {'package': 500, 'length': 40, 'time': 0.5}]},
+        'alignment': {'drift': {'rate': 1000.05, 'drift_ppm': 50.0, 'offset': 2.5, 'step': 1.00005,
+                                'rms_error': 0.0, 'max_error': 0.0}},
+        'files': {sensor_id: f'sensor_{sensor_id}' for sensor_id in sensors},
+        'n_packages': {sensor_id: N_PACKAGES for sensor_id in sensors},
+        'crops': {'plain': [3, N_PACKAGES - 10], 'gaps': [3, N_PACKAGES - 10], 'drift': [2, N_PACKAGES - 10]}
+    }
+    for sensor_id, sensor_info in sensors.items():
+        data = rng.integers(-32768, 32768, size=N_PACKAGES * sensor_info['package_length'] // 2, dtype=np.int16)
+        data.astype('>i2').tofile(os.path.join(session_dir, 'raw_data', session_info['files'][sensor_id]))
+    with open(os.path.join(session_dir, 'metadata', 'session_info.yml'), 'w') as f:
+        yaml.dump(session_info, f, sort_keys=False)
+
+def decode_copy(source_dir, session_dir, chunk_size):
+    shutil.copytree(source_dir, session_dir)
+    decode_session(session_dir, chunk_size)
+    session_info = load_session_info(session_dir)
+    outputs = {}
+    for sensor_id, file_name in session_info['files'].items():
+        with open(get_output_path(session_dir, file_name, 'csv'), 'rb') as f:
+            outputs[sensor_id] = f.read()
+    return outputs
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES[1:])
+def test_chunked_decode_matches_single_shot(tmp_path, chunk_size):
+    source_dir = str(tmp_path / 'source')
+    create_session(source_dir)
+    expected = decode_copy(source_dir, str(tmp_path / 'single_shot'), 0)
+    outputs = decode_copy(source_dir, str(tmp_path / f'chunk_{chunk_size}'), chunk_size)
+    for sensor_id, output in outputs.items():
+        assert len(expected[sensor_id]) > 0
+        assert output == expected[sensor_id], f'{sensor_id} differs with chunk_size={chunk_size}'
+
+def test_decode_cleans_up_stale_outputs(tmp_path):
+    session_dir = str(tmp_path / 'session')
+    create_session(session_dir)
+    decode_session(session_dir)
+    csv_path = get_output_path(session_dir, 'sensor_plain', 'csv')
+    # a part file left by a decode that was killed, its pid no longer runs
+    process = subprocess.Popen(['true'])
+    process.wait()
+    dead_part = f'{get_output_path(session_dir, "sensor_plain", "npz")}.{process.pid}.part'
+    live_part = f'{get_output_path(session_dir, "sensor_plain", "npz")}.{os.getppid()}.part'
+    for part in [dead_part, live_part]:
+        with open(part, 'wb') as f:
+            f.write(b'partial')
+    decode_session(session_dir, output_format='npz')
+    assert not os.path.exists(dead_part)
+    assert os.path.exists(live_part)
+    assert not os.path.exists(csv_path)
+    assert os.path.exists(get_output_path(session_dir, 'sensor_plain', 'npz'))
+
+def create_anchors(start, rate, counts):
+    # a count read at host time t includes the sample in progress, so sample c - 1 started at t - 0.5 / rate
+    anchors = np.empty(len(counts), dtype=ANCHOR_DTYPE)
+    anchors['count'] = counts
+    anchors['time'] = start + (np.asarray(counts) - 0.5) / rate
+    return anchors
+
+def test_fit_anchors_recovers_drift():
+    anchors = create_anchors(100.0, DRIFT_RATE, np.arange(0, 10001, 1000))
+    rate, start, residuals, shifts = fit_anchors(anchors, SAMPLE_RATE)
+    assert rate == pytest.approx(DRIFT_RATE, rel=1e-9)
+    assert start == pytest.approx(100.0, abs=1e-9)
+    assert np.abs(residuals).max() < 1e-9
+    assert shifts == []
+
+def test_fit_anchors_corrects_reset_gap():
+    # the reset estimated the gap 10 samples short, so every anchor after it is counted 10 samples low
+    error = GAP['length'] - GAP['estimate']
+    counts = np.array([0, 1000, 2000, GAP['package'], GAP['package'] + GAP['length'], 4000, 5000, 6000])
+    anchors = create_anchors(100.0, DRIFT_RATE, counts)
+    anchors['count'][4:] -= error
+    rate, start, residuals, shifts = fit_anchors(anchors, SAMPLE_RATE, [4])
+    assert shifts == [-error]
+    assert rate == pytest.approx(DRIFT_RATE, rel=1e-9)
+    assert start == pytest.approx(100.0, abs=1e-9)
+    assert fit_anchors(anchors, SAMPLE_RATE)[0] != pytest.approx(DRIFT_RATE, rel=1e-4)
+
+def create_drift_session(session_dir):
+    # Controller a records at the nominal rate, controller b starts later with a fast clock and one FIFO reset
+    os.makedirs(os.path.join(session_dir, 'metadata'))
+    os.makedirs(os.path.join(session_dir, 'raw_data'))
+    n_produced = {'ref': int(DURATION * SAMPLE_RATE), 'fast': int(DURATION * DRIFT_RATE)}
+    n_raw = {'ref': n_produced['ref'], 'fast': n_produced['fast'] - GAP['length']}
+    counts = {
+        'ref': np.arange(0, n_produced['ref'] + 1, 1000),
+        'fast': np.array([0, 1000, 2000, GAP['package'], GAP['package'] + GAP['length'], 4000, 6000, 8000,
+                          n_produced['fast']])
+    }
+    anchors = {'ref': create_anchors(100.0, SAMPLE_RATE, counts['ref']),
+               'fast': create_anchors(100.0 + START_DELAY, DRIFT_RATE, counts['fast'])}
+    anchors['fast']['count'][4:] -= GAP['length'] - GAP['estimate']
+    for controller_id, sensor_id in [('a', 'ref'), ('b', 'fast')]:
+        # gyro x holds the raw package index so resampled values can be checked against their positions
+        data = np.zeros((n_raw[sensor_id], 3), dtype='>i2')
+        data[:, 0] = np.arange(n_raw[sensor_id])
+        data.tofile(os.path.join(session_dir, 'raw_data', f'sensor_{sensor_id}'))
+        anchors[sensor_id].tofile(os.path.join(session_dir, 'raw_data', f'anchors_{sensor_id}'))
+        gaps = []
+        if sensor_id == 'fast':
+            gaps = [{'package': GAP['package'], 'length': GAP['estimate'], 'time': 3.0, 'anchor': 4}]
+        part = {
+            'name': os.path.basename(session_dir),
+            'controller_id': controller_id,
+            'time': {'start': float(anchors[sensor_id]['time'][0]), 'duration': DURATION},
+            'sensors': {sensor_id: get_sensor_info(accel=False)},
+            'overflows': {sensor_id: [3.0] if gaps else []},
+            'gaps': {sensor_id: gaps},
+            'files': {sensor_id: f'sensor_{sensor_id}'},
+            'anchors': {sensor_id: f'anchors_{sensor_id}'},
+            'n_packages': {sensor_id: n_raw[sensor_id]}
+        }
+        with open(os.path.join(session_dir, 'metadata', f'{controller_id}_session_info.yml'), 'w') as f:
+            yaml.dump(part, f, sort_keys=False)
+
+def get_timeline_values(positions):
+    # raw package index at each timeline position, NaN inside the gap
+    values = np.where(positions < GAP['package'], positions, positions - GAP['length']).astype(np.float64)
+    values[(positions >= GAP['package']) & (positions < GAP['package'] + GAP['length'])] = np.nan
+    return values
+
+def test_merge_resamples_onto_common_timeline(tmp_path):
+    session_dir = str(tmp_path / 'session')
+    create_drift_session(session_dir)
+    merge_session(session_dir)
+    session_info = load_session_info(session_dir)
+    assert session_info['gaps']['fast'][0]['length'] == GAP['length']
+    alignment = session_info['alignment']['fast']
+    assert alignment['rate'] == pytest.approx(DRIFT_RATE, rel=1e-6)
+    assert alignment['step'] == pytest.approx(DRIFT_RATE / SAMPLE_RATE, rel=1e-6)
+    assert alignment['offset'] == pytest.approx(0, abs=1e-3)
+    offset = START_DELAY * SAMPLE_RATE
+    assert session_info['alignment']['ref']['offset'] == pytest.approx(offset, abs=1e-3)
+    # ref starts before fast and ends first, so it bounds the common timeline
+    n_rows = int(np.floor(DURATION * SAMPLE_RATE - 1 - offset)) + 1
+    reader = SessionReader(session_dir)
+    assert [crop[1] - crop[0] for crop in session_info['crops'].values()] == [n_rows, n_rows]
+    assert [reader.get_n_packages(sensor_id) for sensor_id in reader.sensor_ids] == [n_rows, n_rows]
+    factor = session_info['sensors']['fast']['gyro_factor']
+    fast = reader.read_sensor('fast')['gyro_x'].to_numpy() / factor
+    positions = alignment['offset'] + np.arange(n_rows) * alignment['step']
+    lower = np.floor(positions).astype(np.int64)
+    values = get_timeline_values(lower)
+    expected = values + (get_timeline_values(lower + 1) - values) * (positions - lower)
+    np.testing.assert_allclose(fast, expected, atol=1e-6)
+    ref = reader.read_sensor('ref')['gyro_x'].to_numpy() / factor
+    np.testing.assert_allclose(ref, np.arange(n_rows) + offset, atol=1e-6)
+
+@pytest.mark.parametrize('chunk_size', [0, 7, 1000, 3100])
+def test_gap_rows_are_nan(tmp_path, chunk_size):
+    session_dir = str(tmp_path / 'session')
+    create_drift_session(session_dir)
+    merge_session(session_dir)
+    session_info = load_session_info(session_dir)
+    sensor_info = session_info['sensors']['fast']
+    crop = session_info['crops']['fast']
+    gaps = [(gap['package'], gap['length']) for gap in session_info['gaps']['fast']]
+    alignment = session_info['alignment']['fast']
+    source_file_path = os.path.join(session_dir, 'raw_data', 'sensor_fast')
+    n_rows = count_packages(source_file_path, sensor_info, crop, gaps, alignment)
+    chunks = list(iter_decoded_chunks(source_file_path, sensor_info, crop, chunk_size, gaps, alignment))
+    data = np.concatenate(chunks)
+    assert len(data) == n_rows
+    output_gaps = get_output_gaps(gaps, crop, alignment, n_rows)
+    expected = np.zeros(n_rows, dtype=bool)
+    for row, length in output_gaps:
+        expected[row : row + length] = True
+    # rows interpolate between floor(position) and the next sample, either one inside the gap makes them NaN
+    positions = np.floor(alignment['offset'] + np.arange(n_rows) * alignment['step'])
+    touching = (positions + 1 >= GAP['package']) & (positions < GAP['package'] + GAP['length'])
+    np.testing.assert_array_equal(expected, touching)
+    np.testing.assert_array_equal(np.isnan(data).all(axis=1), expected)
+    assert not np.isnan(data[~expected]).any()
+    if chunk_size in (1000, 3100):
+        # a chunk boundary falls inside the gap rows
+        first, length = output_gaps[0]
+        assert any(first < boundary < first + length for boundary in range(chunk_size, n_rows, chunk_size))
\ No newline at end of file
@@ -1,49 +1,68 @@
-import smbus
+import fcntl
 import math
-import signal
-from contextlib import contextmanager
+import os
 
-DEFAULT_READ_TIMEOUT = 1
+DEFAULT_BUS_TIMEOUT = 1
+I2C_TIMEOUT = 0x0702
+I2C_TIMEOUT_UNIT = 0.01
+MAX_BLOCK_LENGTH = 32
 
-class TimeoutException(Exception): pass
-
-@contextmanager
-def read_time_limit(seconds):
-    def signal_handler(signum, frame):
-        raise TimeoutException("I2C read timed out")
-    signal.signal(signal.SIGALRM, signal_handler)
-    signal.alarm(seconds)
+def set_bus_timeout(bus_id, seconds):
+    # The kernel aborts a transfer that exceeds the adapter timeout and the read raises OSError.
+    # The timeout belongs to the adapter, so it is set through a separate handle and holds for any backend.
+    # It counts in 10 ms units, shorter timeouts are rounded up.
+    fd = os.open(f'/dev/i2c-{bus_id}', os.O_RDWR)
     try:
-        yield
+        fcntl.ioctl(fd, I2C_TIMEOUT, max(1, math.ceil(seconds / I2C_TIMEOUT_UNIT)))
     finally:
-        signal.alarm(0)
-        
-def write_bit(bus, address, reg, bit, value):
-    if bit > 7 or bit < 0:
-        raise IndexError('\'bit\' index is out of range')
-    if value > 1 or value < 0:
-        raise ValueError('\'value\' must be equal to 1 or 0')
-    byte = bus.read_byte_data(address, reg)
-    if value:
-        byte |= (1 << bit)
-    else:
-        byte &= ~(1 << bit)
-    bus.write_byte_data(address, reg, byte)
+        os.close(fd)
 
-def write_bits(bus, address, reg, bit, length, value):
+def check_bits(bit, length):
     if bit > 7 or bit < 0:
         raise IndexError('\'bit\' index is out of range')
     if length > bit + 1:
         raise IndexError('bit sequence is to long')
+
+def get_bit(byte, bit):
+    return (byte & (1 << bit)) >> bit
+
+def get_bits(byte, bit, length):
+    mask = 2**(bit + 1) - 1
+    return (byte & mask) >> (bit - length + 1)
+
+def check_bit_value(value):
+    if value > 1 or value < 0:
+        raise ValueError('\'value\' must be equal to 1 or 0')
+
+def check_bits_value(length, value):
     if value >= 2**length:
         raise ValueError('\'value\' binary notation must be lesser then \'length\'')
     if value < 0:
         raise ValueError('\'value\' must be greater or equal to 0')
+
+def set_bit(byte, bit, value):
+    check_bit_value(value)
+    if value:
+        return byte | (1 << bit)
+    return byte & ~(1 << bit)
+
+def set_bits(byte, bit, length, value):
+    check_bits_value(length, value)
     clear_mask = (2**(bit+1)-1)^(2**(bit - length + 1)-1)
-    byte = bus.read_byte_data(address, reg)
     byte = byte ^ (byte & clear_mask)
-    byte |= value << (bit - length + 1)
-    bus.write_byte_data(address, reg, byte)
+    return byte | (value << (bit - length + 1))
+
+def write_bit(bus, address, reg, bit, value):
+    check_bits(bit, 1)
+    check_bit_value(value)
+    byte = bus.read_byte_data(address, reg)
+    bus.write_byte_data(address, reg, set_bit(byte, bit, value))
+
+def write_bits(bus, address, reg, bit, length, value):
+    check_bits(bit, length)
+    check_bits_value(length, value)
+    byte = bus.read_byte_data(address, reg)
+    bus.write_byte_data(address, reg, set_bits(byte, bit, length, value))
     
 def write_byte(bus, address, reg, value):
     bus.write_byte_data(address, reg, value)
@@ -58,38 +77,27 @@ def write_signed_word(bus, address, reg, value):
     bus.write_byte_data(address, reg, value >> 8)
     bus.write_byte_data(address, reg + 1, value % 256)
     
-def read_bit(bus, address, reg, bit, read_timeout=DEFAULT_READ_TIMEOUT):
-    if bit > 7 or bit < 0:
-        raise IndexError('\'bit\' index is out of range')
-    with read_time_limit(read_timeout):
-        byte = bus.read_byte_data(address, reg)
-    result = (byte & (1 << bit)) >> bit 
-    return result
+def read_bit(bus, address, reg, bit):
+    check_bits(bit, 1)
+    byte = bus.read_byte_data(address, reg)
+    return get_bit(byte, bit)
     
-def read_bits(bus, address, reg, bit, length, read_timeout=DEFAULT_READ_TIMEOUT):
-    if bit > 7 or bit < 0:
-        raise IndexError('\'bit\' index is out of range')
-    if length > bit + 1:
-        raise IndexError('bit sequence is to long')
-    with read_time_limit(read_timeout):
-        byte = bus.read_byte_data(address, reg)
-    mask = 2**(bit + 1) - 1
-    result = (byte & mask) >> (bit - length + 1)
-    return result
+def read_bits(bus, address, reg, bit, length):
+    check_bits(bit, length)
+    byte = bus.read_byte_data(address, reg)
+    return get_bits(byte, bit, length)
 
-def read_byte(bus, address, reg, read_timeout=DEFAULT_READ_TIMEOUT):
-    with read_time_limit(read_timeout):
-        result = bus.read_byte_data(address, reg)
+def read_byte(bus, address, reg):
+    result = bus.read_byte_data(address, reg)
     return result
 
-def read_word(bus, address, reg, read_timeout=DEFAULT_READ_TIMEOUT):
-    with read_time_limit(read_timeout):
-        buffer = bus.read_i2c_block_data(address, reg, 2)
+def read_word(bus, address, reg):
+    buffer = bus.read_i2c_block_data(address, reg, 2)
     result = (buffer[0] << 8) + buffer[1]
     return result
 
-def read_signed_word(bus, address, reg, read_timeout=DEFAULT_READ_TIMEOUT):
-    result = read_word(bus, address, reg, read_timeout)
+def read_signed_word(bus, address, reg):
+    result = read_word(bus, address, reg)
     if (result >= 0x8000):
         return -((65535 - result) + 1)
     else:
@@ -98,7 +106,18 @@ def read_signed_word(bus, address, reg, read_timeout=DEFAULT_READ_TIMEOUT):
 def write_bytes(bus, address, reg, values):
     bus.write_i2c_block_data(address, reg, values)
 
-def read_bytes(bus, address, reg, length, read_timeout=DEFAULT_READ_TIMEOUT):
-    with read_time_limit(read_timeout):
-        result = bus.read_i2c_block_data(address, reg, length)
+def read_bytes(bus, address, reg, length):
+    result = bus.read_i2c_block_data(address, reg, length)
+    return result
+
+def read_long_bytes(bus, address, reg, length, i2c_msg=None):
+    if i2c_msg is not None:
+        write = i2c_msg.write(address, [reg])
+        read = i2c_msg.read(address, length)
+        bus.i2c_rdwr(write, read)
+        result = list(read)
+    else:
+        result = []
+        while len(result) < length:
+            result += bus.read_i2c_block_data(address, reg, min(MAX_BLOCK_LENGTH, length - len(result)))
     return result
\ No newline at end of file
@@ -2,6 +2,10 @@ from paho.mqtt import client as mqtt_client
 import time
 from mpu6050 import MPU6050
 from mpu6050_manager import MPU6050_Manager
+from live_orientation import LiveOrientation
+from session_worker import SessionWorker
+from session_streamer import SessionStreamer
+from upload_spool import UploadSpool
 import yaml
 import os
 import shutil
@@ -17,16 +21,95 @@ topic_control     = cfg['mqtt']['topic']['control']
 topic_info        = cfg['mqtt']['topic']['info']
 client_ip         = cfg['client']['ip']
 client_port       = cfg['client']['port']
+live_cfg          = cfg['live_orientation']
+acquisition_cfg   = cfg['acquisition']
+upload_cfg        = cfg['upload']
+bus_backend       = cfg['i2c']['backend']
+bus_options       = cfg['i2c'].get(bus_backend)
+shadow_registers  = cfg['i2c'].get('shadow_registers', False)
+profiles          = cfg.get('profiles', {})
 sensor_ids        = [sensor['id'] for sensor in cfg['sensors']]
 sensor_buses      = [sensor['bus'] for sensor in cfg['sensors']]
 sensor_addresses  = [sensor['address'] for sensor in cfg['sensors']]
 sensor_settings   = [sensor['settings'] for sensor in cfg['sensors']]
 
+# Commands that do not touch the sensors and may run while a session is in progress
+SESSION_SAFE_COMMANDS = ['ping_sensors', 'stop_session', 'session_status', 'spool_status']
+
 def publish(client, topic, msg_type, msg):
     payload = {'type': msg_type, 'device_id': device_id, 'msg': msg}
     payload = yaml.dump(payload)
     result = client.publish(topic, payload)
     
+def save_sensor_settings(ids, settings):
+    with open('config.yml', 'r') as f:
+        cfg = yaml.safe_load(f)
+    for sensor_id in ids:
+        cfg['sensors'][sensor_ids.index(sensor_id)]['settings'] = dict(settings)
+    with open('config.yml', 'w') as f:
+        yaml.dump(cfg, f, sort_keys=False)
+
+def publish_session_state(status):
+    if status['state'] == 'failed':
+        publish(client, topic_info, 'error', f'Session \'{status["session_name"]}\' failed: {status["error"]}')
+    else:
+        publish(client, topic_info, 'info', f'Session \'{status["session_name"]}\' {status["state"]}')
+
+def create_streamer(session_name):
+    return SessionStreamer(f"http://{client_ip}:{client_port}/stream", session_name, upload_cfg['chunk_size'],
+                           upload_cfg['interval'], upload_cfg['timeout'])
+
+def publish_spool_upload(session_name):
+    publish(client, topic_info, 'success', f'Uploaded spooled session \'{session_name}\'')
+
+def run_session(args, stop, set_state):
+    session_name = args['session_name']
+    duration     = args['duration']
+    start_time   = args.get('start_time')
+    live_orientation = None
+    if live_cfg['enabled']:
+        live_orientation = LiveOrientation(lambda msg: client.publish(live_cfg['topic'], msg),
+                                           live_cfg['publish_rate'], live_cfg['beta'], live_cfg['budget'])
+    stream = None
+    if upload_cfg['mode'] == 'stream':
+        stream = create_streamer(session_name)
+        stream.start()
+    try:
+        session_info = manager.start_session(session_name, duration, live_orientation,
+                                             acquisition_cfg['watermark'], acquisition_cfg['max_interval'],
+                                             acquisition_cfg['buffer_size'], acquisition_cfg['flush_size'],
+                                             acquisition_cfg['flush_interval'], acquisition_cfg['anchor_interval'],
+                                             start_time, stop, lambda time_start: set_state('recording'), stream)
+    except Exception:
+        if stream is not None:
+            stream.close()
+        raise
+    set_state('uploading')
+    if stream is not None:
+        try:
+            stream.finish(session_name)
+        except Exception as e:
+            # the session stays on disk and the spool resumes it from the offsets the client acknowledged
+            spool.add(session_name, session_name)
+            publish(client, topic_info, 'error', f'Upload of \'{session_name}\' failed, spooled for retry: {e}')
+        else:
+            shutil.rmtree(os.path.join(session_name))
+    else:
+        archive_name = f'{session_name}_{device_id}'
+        shutil.make_archive(archive_name, 'zip', session_name)
+        url = f"http://{client_ip}:{client_port}/upload"
+        headers = {'Type':'session_part'}
+        files = [('file',(f'{archive_name}.zip', open(f'{archive_name}.zip','rb'),'application/zip'))]
+        payload = {'session_name': session_name}
+        response = requests.request("POST", url, headers=headers, data=payload, files=files)
+        os.remove(f'{archive_name}.zip')
+        shutil.rmtree(os.path.join(session_name))
+    start_skew = session_info['time']['start_skew']
+    if start_skew is None:
+        publish(client, topic_info, 'success', 'Session finished')
+    else:
+        publish(client, topic_info, 'success', f'Session finished, start skew {start_skew * 1000:.1f} ms')
+
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print('Connected to MQTT Broker!')
@@ -40,6 +123,10 @@ def on_message(client, userdata, msg):
         if msg.topic == topic_control:
             payload = yaml.safe_load(msg.payload.decode())
             cmd = payload['command']
+            if worker.is_busy() and cmd not in SESSION_SAFE_COMMANDS:
+                publish(client, topic_info, 'error',
+                        f'Cannot run \'{cmd}\' while session \'{worker.session_name}\' is {worker.state}')
+                return
             if cmd == 'ping_sensors':
                 sensors = ', '.join(manager.sensors.keys())
                 publish(client, topic_info, 'info', f'Connected sensors: {sensors}')
@@ -111,6 +198,13 @@ def on_message(client, userdata, msg):
                 with open('config.yml', 'w') as f:
                     yaml.dump(cfg, f, sort_keys=False)
                 publish(client, topic_info, 'success', 'Configurated all sensors')
+            elif cmd == 'apply_profile':
+                args = payload['args']
+                profile = args['profile']
+                ids = [args['sensor_id']] if args.get('sensor_id') else list(manager.sensors.keys())
+                manager.apply_profile(profile, ids)
+                save_sensor_settings(ids, manager.profiles[profile]['settings'])
+                publish(client, topic_info, 'success', f'Applied profile \'{profile}\' to {", ".join(ids)}')
             elif cmd == 'calibrate_sensor':
                 args = payload['args']
                 sensor_id = args['sensor_id']
@@ -135,39 +229,44 @@ def on_message(client, userdata, msg):
                 publish(client, topic_info, 'success', 'Calibrated all sensors')
             elif cmd == 'start_session':
                 args = payload['args']
-                session_name = args['session_name']
-                duration     = args['duration']
-                manager.start_session(session_name, duration)
-                archive_name = f'{session_name}_{device_id}'
-                shutil.make_archive(archive_name, 'zip', session_name)
-                url = f"http://{client_ip}:{client_port}/upload"
-                headers = {'Type':'session_part'}
-                files = [('file',(f'{archive_name}.zip', open(f'{archive_name}.zip','rb'),'application/zip'))]
-                payload = {'session_name': session_name}
-                response = requests.request("POST", url, headers=headers, data=payload, files=files)
-                os.remove(f'{archive_name}.zip')
-                shutil.rmtree(os.path.join(session_name))
-                publish(client, topic_info, 'success', 'Session finished')
+                worker.submit(args['session_name'], lambda stop, set_state: run_session(args, stop, set_state))
+            elif cmd == 'stop_session':
+                if worker.request_stop():
+                    publish(client, topic_info, 'info', f'Stopping session \'{worker.session_name}\'')
+                else:
+                    publish(client, topic_info, 'error', 'No session in progress')
+            elif cmd == 'session_status':
+                publish(client, topic_info, 'info', worker.get_status())
+            elif cmd == 'spool_status':
+                publish(client, topic_info, 'info', spool.get_status())
     except Exception as e:
         publish(client, topic_info, 'error', 'Unexpected error: ' + str(e))
         
+worker = SessionWorker(publish_session_state)
+spool = UploadSpool(upload_cfg['spool_path'], create_streamer, upload_cfg['spool_interval'],
+                    upload_cfg['max_spool_interval'], publish_spool_upload)
+
 if __name__ == '__main__':
+    spool.start()
     while True:
         try:
-            manager = MPU6050_Manager(device_id, sensor_ids, sensor_buses, sensor_addresses)
-            for i, sensor_id in enumerate(sensor_ids):
-                clock_source           = sensor_settings[i]['clock_source']
-                dlpf_mode              = sensor_settings[i]['dlpf_mode']
-                rate                   = sensor_settings[i]['rate']
-                full_scale_accel_range = sensor_settings[i]['full_scale_accel_range']
-                full_scale_gyro_range  = sensor_settings[i]['full_scale_gyro_range']
-                accel_fifo_enabled     = sensor_settings[i]['accel_fifo_enabled']
-                x_gyro_fifo_enabled    = sensor_settings[i]['x_gyro_fifo_enabled']
-                y_gyro_fifo_enabled    = sensor_settings[i]['y_gyro_fifo_enabled']
-                z_gyro_fifo_enabled    = sensor_settings[i]['z_gyro_fifo_enabled']
-                manager.configurate_sensor(sensor_id, clock_source, dlpf_mode, rate,
-                                               full_scale_accel_range, full_scale_gyro_range,
-                                               accel_fifo_enabled, x_gyro_fifo_enabled, y_gyro_fifo_enabled, z_gyro_fifo_enabled)
+            # a reconnect while a session is running keeps the manager and sensor setup of that session
+            if not worker.is_busy():
+                manager = MPU6050_Manager(device_id, sensor_ids, sensor_buses, sensor_addresses, bus_backend, bus_options,
+                                          shadow_registers, profiles)
+                for i, sensor_id in enumerate(sensor_ids):
+                    clock_source           = sensor_settings[i]['clock_source']
+                    dlpf_mode              = sensor_settings[i]['dlpf_mode']
+                    rate                   = sensor_settings[i]['rate']
+                    full_scale_accel_range = sensor_settings[i]['full_scale_accel_range']
+                    full_scale_gyro_range  = sensor_settings[i]['full_scale_gyro_range']
+                    accel_fifo_enabled     = sensor_settings[i]['accel_fifo_enabled']
+                    x_gyro_fifo_enabled    = sensor_settings[i]['x_gyro_fifo_enabled']
+                    y_gyro_fifo_enabled    = sensor_settings[i]['y_gyro_fifo_enabled']
+                    z_gyro_fifo_enabled    = sensor_settings[i]['z_gyro_fifo_enabled']
+                    manager.configurate_sensor(sensor_id, clock_source, dlpf_mode, rate,
+                                                   full_scale_accel_range, full_scale_gyro_range,
+                                                   accel_fifo_enabled, x_gyro_fifo_enabled, y_gyro_fifo_enabled, z_gyro_fifo_enabled)
             
             client = mqtt_client.Client(device_id)
             client.on_connect = on_connect
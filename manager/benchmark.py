@@ -0,0 +1,314 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import signal
+import tempfile
+import time
+import tracemalloc
+import yaml
+import I2C
+import mpu6050_manager
+import smbus_emulator
+from mpu6050 import (MPU6050, MPU6050_ADDRESS_AD0_LOW, MPU6050_RA_FIFO_COUNTH, MPU6050_RA_USER_CTRL,
+                     MPU6050_USERCTRL_FIFO_EN_BIT, MPU6050_Base)
+from mpu6050_manager import MPU6050_Manager
+from session_writer import RingBuffer
+
+def create_manager(args, n_sensors):
+    smbus_emulator.EMULATED_BUSES.clear()
+    options = {'latency': args.latency, 'byte_time': args.byte_time, 'rdwr': not args.no_rdwr, 'drift': args.drift}
+    sensor_ids = [f'mpu6050_{i}' for i in range(n_sensors)]
+    bus_ids = [i % args.buses for i in range(n_sensors)]
+    addresses = [MPU6050_ADDRESS_AD0_LOW + i // args.buses for i in range(n_sensors)]
+    manager = MPU6050_Manager('benchmark', sensor_ids, bus_ids, addresses, 'emulator', options)
+    manager.configurate_sensors(1, args.dlpf, args.rate, 0, 0, True, True, True, True)
+    return manager
+
+def get_buses():
+    return list(smbus_emulator.EMULATED_BUSES.values())
+
+class StallingFile:
+    # Emulates SD card write latency spikes: one write per period blocks for 'stall' seconds
+    def __init__(self, f, stall, period):
+        self.f = f
+        self.stall = stall
+        self.period = period
+        self.next_stall = time.monotonic() + period
+
+    def write(self, data):
+        if time.monotonic() >= self.next_stall:
+            time.sleep(self.stall)
+            self.next_stall = time.monotonic() + self.period
+        return self.f.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+def stalling_open(args):
+    def open_file(file_path, mode='r', *params):
+        f = open(file_path, mode, *params)
+        if 'w' in mode and 'raw_data' in file_path:
+            return StallingFile(f, args.write_stall, args.stall_period)
+        return f
+    return open_file
+
+def run_session(args, n_sensors):
+    manager = create_manager(args, n_sensors)
+    for bus in get_buses():
+        bus.reset_stats()
+        for device in bus.devices.values():
+            device.overflows = 0
+    cwd = os.getcwd()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        os.chdir(tmp_dir)
+        if args.write_stall > 0:
+            mpu6050_manager.open = stalling_open(args)
+        cpu_start = time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.start_session('benchmark', args.duration)
+        cpu_time = time.process_time() - cpu_start
+        with open(os.path.join('benchmark', 'metadata', 'benchmark_session_info.yml'), 'r') as f:
+            session_info = yaml.safe_load(f)
+    finally:
+        if args.write_stall > 0:
+            del mpu6050_manager.open
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir)
+    sample_rate = next(iter(manager.sensors.values())).sample_rate
+    return {
+        'sample_rate': sample_rate,
+        'expected': sample_rate * args.duration,
+        'packages': min(session_info['n_packages'].values()),
+        'overflows': sum(map(len, session_info['overflows'].values())),
+        'emulator_overflows': sum(device.overflows for bus in get_buses() for device in bus.devices.values()),
+        'transactions': sum(bus.transactions for bus in get_buses()),
+        'cpu': cpu_time / args.duration
+    }
+
+def print_result(n_sensors, result):
+    print(f'{n_sensors:>8}{result["sample_rate"]:>8.0f}{result["packages"]:>10}{result["expected"]:>10.0f}'
+          f'{result["overflows"]:>11}{result["emulator_overflows"]:>11}{result["transactions"]:>14}{result["cpu"] * 100:>7.0f}%')
+
+def benchmark_session(args):
+    print(f'{"sensors":>8}{"rate":>8}{"packages":>10}{"expected":>10}{"overflows":>11}{"emulated":>11}{"transactions":>14}{"cpu":>8}')
+    print_result(args.sensors, run_session(args, args.sensors))
+
+def benchmark_capacity(args):
+    print(f'{"sensors":>8}{"rate":>8}{"packages":>10}{"expected":>10}{"overflows":>11}{"emulated":>11}{"transactions":>14}{"cpu":>8}')
+    max_sensors = 0
+    for n_sensors in range(1, args.sensors + 1):
+        result = run_session(args, n_sensors)
+        print_result(n_sensors, result)
+        if result['emulator_overflows']:
+            break
+        max_sensors = n_sensors
+    print(f'Max sensors without overflow: {max_sensors}')
+
+@contextlib.contextmanager
+def signal_time_limit(seconds):
+    def signal_handler(signum, frame):
+        raise TimeoutError("I2C read timed out")
+    signal.signal(signal.SIGALRM, signal_handler)
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+
+def read_word_signal(bus, address, reg, read_timeout=1):
+    with signal_time_limit(read_timeout):
+        buffer = bus.read_i2c_block_data(address, reg, 2)
+    return (buffer[0] << 8) + buffer[1]
+
+def read_word_unguarded(bus, address, reg):
+    buffer = bus.read_i2c_block_data(address, reg, 2)
+    return (buffer[0] << 8) + buffer[1]
+
+def benchmark_read(args):
+    bus = smbus_emulator.EmulatedSMBus(0)
+    address = MPU6050_ADDRESS_AD0_LOW
+    n_reads = args.reads
+    functions = {
+        'unguarded': lambda: read_word_unguarded(bus, address, MPU6050_RA_FIFO_COUNTH),
+        'sigalrm': lambda: read_word_signal(bus, address, MPU6050_RA_FIFO_COUNTH),
+        'read_word': lambda: I2C.read_word(bus, address, MPU6050_RA_FIFO_COUNTH)
+    }
+    times = {}
+    for name, function in functions.items():
+        time_start = time.perf_counter()
+        for _ in range(n_reads):
+            function()
+        times[name] = (time.perf_counter() - time_start) / n_reads
+    print(f'{"read":>10}{"us/read":>10}{"overhead":>10}')
+    for name, elapsed in times.items():
+        print(f'{name:>10}{elapsed * 1e6:>10.2f}{(elapsed - times["unguarded"]) * 1e6:>10.2f}')
+
+def count_transactions(bus, function):
+    bus.reset_stats()
+    function()
+    return bus.transactions
+
+def get_session_metadata(sensor):
+    return [sensor.clock_source, sensor.dlpf_mode, sensor.rate, sensor.sample_rate, sensor.full_scale_accel_range,
+            sensor.full_scale_gyro_range, sensor.accel_factor, sensor.gyro_factor, sensor.accel_fifo_enabled,
+            sensor.x_gyro_fifo_enabled, sensor.y_gyro_fifo_enabled, sensor.z_gyro_fifo_enabled, sensor.package_length]
+
+def configurate(sensor, args):
+    sensor.clock_source = 1
+    sensor.dlpf_mode = args.dlpf
+    sensor.rate = args.rate
+    sensor.full_scale_accel_range = 0
+    sensor.full_scale_gyro_range = 0
+    sensor.accel_fifo_enabled = True
+    sensor.x_gyro_fifo_enabled = True
+    sensor.y_gyro_fifo_enabled = True
+    sensor.z_gyro_fifo_enabled = True
+
+def benchmark_config(args):
+    steps = ['init', 'configurate', 'metadata', 'reset_fifo', 'reset', 'sync']
+    counts = {}
+    for shadow in [False, True]:
+        smbus_emulator.EMULATED_BUSES.clear()
+        bus = smbus_emulator.get_bus(0)
+        sensor = None
+        def init():
+            nonlocal sensor
+            sensor = MPU6050('benchmark', 0, MPU6050_ADDRESS_AD0_LOW, 'emulator', shadow=shadow)
+        counts[shadow] = [
+            count_transactions(bus, init),
+            count_transactions(bus, lambda: configurate(sensor, args)),
+            count_transactions(bus, lambda: get_session_metadata(sensor)),
+            count_transactions(bus, sensor.reset_fifo),
+            count_transactions(bus, sensor.reset),
+            count_transactions(bus, sensor.sync_shadow)
+        ]
+    print(f'{"step":>12}{"direct":>8}{"shadow":>8}')
+    for i, step in enumerate(steps):
+        print(f'{step:>12}{counts[False][i]:>8}{counts[True][i]:>8}')
+
+def benchmark_profile(args):
+    settings = {'clock_source': 1, 'dlpf_mode': args.dlpf, 'rate': args.rate, 'full_scale_accel_range': 0,
+                'full_scale_gyro_range': 0, 'accel_fifo_enabled': True, 'x_gyro_fifo_enabled': True,
+                'y_gyro_fifo_enabled': True, 'z_gyro_fifo_enabled': True}
+    print(f'{"method":>12}{"transactions":>14}{"time, ms":>10}')
+    for method in ['properties', 'shadow', 'profile']:
+        smbus_emulator.EMULATED_BUSES.clear()
+        options = {'latency': args.latency, 'byte_time': args.byte_time}
+        sensor_ids = [f'mpu6050_{i}' for i in range(args.sensors)]
+        bus_ids = [i % args.buses for i in range(args.sensors)]
+        addresses = [MPU6050_ADDRESS_AD0_LOW + i // args.buses for i in range(args.sensors)]
+        manager = MPU6050_Manager('benchmark', sensor_ids, bus_ids, addresses, 'emulator', options,
+                                  method == 'shadow', {'benchmark': settings})
+        for bus in get_buses():
+            bus.reset_stats()
+        time_start = time.perf_counter()
+        if method == 'profile':
+            manager.apply_profile('benchmark')
+        else:
+            for sensor in manager.sensors.values():
+                configurate(sensor, args)
+        elapsed = time.perf_counter() - time_start
+        transactions = sum(bus.transactions for bus in get_buses())
+        print(f'{method:>12}{transactions:>14}{elapsed * 1000:>10.1f}')
+
+class StaticFifoBus:
+    # Zero-latency bus that always reports the same FIFO content, so only the host-side read path is measured
+    def __init__(self, n_bytes, rdwr):
+        self.i2c_msg = smbus_emulator.I2CMessage if rdwr else None
+        self.count = [n_bytes >> 8, n_bytes & 0xFF]
+        self.data = bytes(range(256)) * (n_bytes // 256 + 1)
+        self.view = memoryview(self.data)
+        self.blocks = {length: list(self.data[:length]) for length in range(1, I2C.MAX_BLOCK_LENGTH + 1)}
+        self.registers = {MPU6050_RA_USER_CTRL: 1 << MPU6050_USERCTRL_FIFO_EN_BIT}
+
+    def read_byte_data(self, address, reg):
+        return self.registers.get(reg, 0)
+
+    def write_byte_data(self, address, reg, value):
+        self.registers[reg] = value
+
+    def read_i2c_block_data(self, address, reg, length):
+        if reg == MPU6050_RA_FIFO_COUNTH:
+            return self.count
+        return self.blocks[length]
+
+    def i2c_rdwr(self, write, read):
+        if write.buf[0] == MPU6050_RA_FIFO_COUNTH:
+            read.buf[:2] = self.count
+        else:
+            memoryview(read.buf)[: read.len] = self.view[: read.len]
+
+def measure_poll(poll, n_polls, repeat=5):
+    elapsed = float('inf')
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        for _ in range(n_polls):
+            poll()
+        elapsed = min(elapsed, (time.perf_counter() - time_start) / n_polls)
+    tracemalloc.start()
+    poll()
+    peak = 0
+    for _ in range(100):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        poll()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return elapsed, peak
+
+def benchmark_poll(args):
+    print(f'{"path":>10}{"rdwr":>6}{"us/poll":>10}{"alloc, B":>10}')
+    for rdwr in [False, True]:
+        smbus_emulator.EMULATED_BUSES['static'] = StaticFifoBus(args.poll_bytes, rdwr)
+        sensor = MPU6050_Base('static', MPU6050_ADDRESS_AD0_LOW, 'emulator')
+        reader = sensor.get_fifo_reader()
+        def legacy_poll():
+            fifo_count = sensor.get_fifo_count()
+            return bytes(sensor.get_fifo_bytes(fifo_count))
+        ring = RingBuffer(1 << 16)
+        def fast_poll():
+            # read and hand over to the ring buffer like _read_bus does
+            fifo_count = reader.read_count()
+            length = reader.read_data(fifo_count)
+            ring.put(reader.view, length)
+            ring.consume(length)
+        for name, poll in [('legacy', legacy_poll), ('fast', fast_poll)]:
+            elapsed, peak = measure_poll(poll, args.reads // 10)
+            print(f'{name:>10}{str(rdwr):>6}{elapsed * 1e6:>10.2f}{peak:>10}')
+        del smbus_emulator.EMULATED_BUSES['static']
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark acquisition on emulated MPU6050 sensors')
+    parser.add_argument('mode', choices=['session', 'capacity', 'read', 'config', 'profile', 'poll'])
+    parser.add_argument('--sensors', type=int, default=4)
+    parser.add_argument('--buses', type=int, default=1)
+    parser.add_argument('--rate', type=int, default=9)
+    parser.add_argument('--dlpf', type=int, default=6)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--latency', type=float, default=0.0001)
+    parser.add_argument('--byte-time', type=float, default=0.0000225)
+    parser.add_argument('--reads', type=int, default=100000)
+    parser.add_argument('--no-rdwr', action='store_true')
+    parser.add_argument('--poll-bytes', type=int, default=384)
+    parser.add_argument('--write-stall', type=float, default=0)
+    parser.add_argument('--stall-period', type=float, default=1)
+    parser.add_argument('--drift', type=float, default=0)
+    args = parser.parse_args()
+    if args.mode == 'session':
+        benchmark_session(args)
+    elif args.mode == 'read':
+        benchmark_read(args)
+    elif args.mode == 'config':
+        benchmark_config(args)
+    elif args.mode == 'profile':
+        benchmark_profile(args)
+    elif args.mode == 'poll':
+        benchmark_poll(args)
+    else:
+        benchmark_capacity(args)
\ No newline at end of file
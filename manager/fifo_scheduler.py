@@ -0,0 +1,69 @@
+import heapq
+
+FIFO_SIZE = 1024
+DEFAULT_WATERMARK = 0.5
+DEFAULT_MAX_INTERVAL = 0.1
+MIN_INTERVAL = 0.001
+RATE_SMOOTHING = 0.2
+MAX_RATE_DEVIATION = 2.0
+
+class FifoScheduler:
+    def __init__(self, watermark=DEFAULT_WATERMARK, max_interval=DEFAULT_MAX_INTERVAL):
+        if watermark <= 0 or watermark > 1:
+            raise ValueError('\'watermark\' must be in range (0, 1]')
+        self.watermark = watermark * FIFO_SIZE
+        self.max_interval = max_interval
+        self.queue = []
+        self.nominal_rates = {}
+        self.byte_rates = {}
+        self.residuals = {}
+        self.last_service = {}
+        self.n_services = 0
+        self.n_empty = 0
+
+    def add(self, key, byte_rate):
+        self.nominal_rates[key] = byte_rate
+        self.byte_rates[key] = byte_rate
+        self.residuals[key] = 0
+
+    def start(self, now):
+        # spread first deadlines so sensors with equal rates are not serviced back to back
+        keys = list(self.byte_rates.keys())
+        for i, key in enumerate(keys):
+            self.last_service[key] = now
+            heapq.heappush(self.queue, (now + self.get_interval(key) * (i + 1) / len(keys), key))
+
+    def get_interval(self, key):
+        interval = (self.watermark - self.residuals[key]) / self.byte_rates[key]
+        return min(self.max_interval, max(MIN_INTERVAL, interval))
+
+    def next_due(self):
+        return self.queue[0][0]
+
+    def pop(self):
+        return heapq.heappop(self.queue)[1]
+
+    def update(self, key, now, fifo_count, n_bytes_read):
+        elapsed = now - self.last_service[key]
+        if elapsed > 0 and fifo_count < FIFO_SIZE:
+            observed = (fifo_count - self.residuals[key]) / elapsed
+            byte_rate = self.byte_rates[key] + RATE_SMOOTHING * (observed - self.byte_rates[key])
+            nominal = self.nominal_rates[key]
+            self.byte_rates[key] = min(nominal * MAX_RATE_DEVIATION, max(nominal / MAX_RATE_DEVIATION, byte_rate))
+        self.residuals[key] = fifo_count - n_bytes_read
+        self.last_service[key] = now
+        self.n_services += 1
+        if n_bytes_read == 0:
+            self.n_empty += 1
+        heapq.heappush(self.queue, (now + self.get_interval(key), key))
+
+    def reset(self, key, now):
+        self.residuals[key] = 0
+        self.last_service[key] = now
+        heapq.heappush(self.queue, (now + self.get_interval(key), key))
+
+    def get_stats(self):
+        return {
+            'services': self.n_services,
+            'empty_services': self.n_empty
+        }
\ No newline at end of file
@@ -0,0 +1,123 @@
+import json
+import math
+import struct
+import time
+
+DEFAULT_PUBLISH_RATE = 10
+DEFAULT_BETA = 0.1
+DEFAULT_BUDGET = 0.2
+BUDGET_WINDOW = 1.0
+MAX_STRIDE = 64
+SAMPLE_LENGTH = 12
+
+unpack_sample = struct.Struct('>hhhhhh').unpack_from
+
+class MadgwickFilter:
+    def __init__(self, beta=DEFAULT_BETA):
+        self.beta = beta
+        self.q = (1.0, 0.0, 0.0, 0.0)
+
+    def update(self, ax, ay, az, gx, gy, gz, dt):
+        w, x, y, z = self.q
+        norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if norm > 0:
+            ax, ay, az = ax / norm, ay / norm, az / norm
+            f1 = 2 * (x * z - w * y) - ax
+            f2 = 2 * (w * x + y * z) - ay
+            f3 = 1 - 2 * (x * x + y * y) - az
+            s0 = -2 * y * f1 + 2 * x * f2
+            s1 = 2 * z * f1 + 2 * w * f2 - 4 * x * f3
+            s2 = -2 * w * f1 + 2 * z * f2 - 4 * y * f3
+            s3 = 2 * x * f1 + 2 * y * f2
+            norm = math.sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+            norm = self.beta / norm if norm > 0 else 0
+        else:
+            s0 = s1 = s2 = s3 = norm = 0
+        dw = 0.5 * (-x * gx - y * gy - z * gz) - norm * s0
+        dx = 0.5 * (w * gx + y * gz - z * gy) - norm * s1
+        dy = 0.5 * (w * gy - x * gz + z * gx) - norm * s2
+        dz = 0.5 * (w * gz + x * gy - y * gx) - norm * s3
+        w, x, y, z = w + dw * dt, x + dx * dt, y + dy * dt, z + dz * dt
+        norm = 1 / math.sqrt(w * w + x * x + y * y + z * z)
+        self.q = (w * norm, x * norm, y * norm, z * norm)
+
+class LiveSensor:
+    def __init__(self, sensor, beta):
+        self.gyro_factor = math.radians(sensor.gyro_factor)
+        self.dt = 1.0 / sensor.sample_rate
+        self.filter = MadgwickFilter(beta)
+        self.skip = 0
+
+class LiveOrientation:
+    def __init__(self, publish, publish_rate=DEFAULT_PUBLISH_RATE, beta=DEFAULT_BETA, budget=DEFAULT_BUDGET):
+        self.publish = publish
+        self.publish_interval = 1.0 / publish_rate
+        self.beta = beta
+        self.budget = budget
+        self.sensors = {}
+        self.stride = 1
+        self.max_stride = 1
+        self.filter_time = 0
+        self.total_filter_time = 0
+        self.n_updates = 0
+        self.n_published = 0
+        self.window_start = None
+        self.next_publish = None
+
+    @staticmethod
+    def is_supported(sensor):
+        return (sensor.package_length == SAMPLE_LENGTH and sensor.accel_fifo_enabled and sensor.x_gyro_fifo_enabled
+                and sensor.y_gyro_fifo_enabled and sensor.z_gyro_fifo_enabled)
+
+    def add_sensor(self, sensor):
+        if LiveOrientation.is_supported(sensor):
+            self.sensors[sensor.id] = LiveSensor(sensor, self.beta)
+
+    def start(self, now):
+        self.window_start = now
+        self.next_publish = now + self.publish_interval
+
+    def feed(self, sensor_id, data):
+        live_sensor = self.sensors.get(sensor_id)
+        if live_sensor is None:
+            return
+        time_start = time.perf_counter()
+        stride = self.stride
+        # only every stride-th sample is decoded, skip carries the phase over to the next chunk
+        start = live_sensor.skip
+        n_samples = len(data) // SAMPLE_LENGTH
+        update, factor, dt = live_sensor.filter.update, live_sensor.gyro_factor, live_sensor.dt * stride
+        for offset in range(start * SAMPLE_LENGTH, len(data), stride * SAMPLE_LENGTH):
+            ax, ay, az, gx, gy, gz = unpack_sample(data, offset)
+            update(ax, ay, az, gx * factor, gy * factor, gz * factor, dt)
+            self.n_updates += 1
+        live_sensor.skip = (start - n_samples) % stride
+        elapsed = time.perf_counter() - time_start
+        self.filter_time += elapsed
+        self.total_filter_time += elapsed
+
+    def poll(self, now):
+        if now - self.window_start >= BUDGET_WINDOW:
+            load = self.filter_time / (now - self.window_start)
+            if load > self.budget and self.stride < MAX_STRIDE:
+                self.stride *= 2
+            elif load < self.budget / 4 and self.stride > 1:
+                self.stride //= 2
+            self.max_stride = max(self.max_stride, self.stride)
+            self.filter_time = 0
+            self.window_start = now
+        if now >= self.next_publish:
+            payload = {sensor_id: [round(v, 5) for v in live_sensor.filter.q]
+                       for sensor_id, live_sensor in self.sensors.items()}
+            self.publish(json.dumps({'time': now, 'quaternions': payload}))
+            self.n_published += 1
+            self.next_publish = now + self.publish_interval * self.stride
+
+    def get_stats(self):
+        return {
+            'sensors': list(self.sensors.keys()),
+            'updates': self.n_updates,
+            'published': self.n_published,
+            'cost_per_update_us': self.total_filter_time / self.n_updates * 1e6 if self.n_updates else 0.0,
+            'max_stride': self.max_stride
+        }
\ No newline at end of file
@@ -1,7 +1,17 @@
 import I2C
-import smbus
+import ctypes
 import struct
 
+try:
+    import smbus
+except ImportError:
+    smbus = None
+
+try:
+    import smbus2
+except ImportError:
+    smbus2 = None
+
 #converted from Jeff Rowberg code https://github.com/jrowberg/i2cdevlib/blob/master/Arduino/MPU6050/MPU6050.h
 
 MPU6050_ADDRESS_AD0_LOW     = 0x68 # address pin low (GND), default for InvenSense evaluation board
@@ -384,6 +394,7 @@ MPU6050_DMP_MEMORY_CHUNK_SIZE   = 16
 
 MPU6050_DEFAULT_GYRO_OUTPUT_RATE = 8000
 MPU6050_DLPF_GYRO_OUTPUT_RATE = 1000
+MPU6050_FIFO_SIZE = 1024
 
 MPU6050_GYRO_OFFSET_FACTOR = 4
 MPU6050_ACCEL_OFFSET_FACTOR = 8
@@ -391,6 +402,125 @@ MPU6050_ACCEL_OFFSET_FACTOR = 8
 MPU6050_TEMP_FACTOR = 1.0 / 340.0
 MPU6050_TEMP_OFFSET = 36.53
 
+def open_bus(bus_id, backend='smbus', **options):
+    if backend == 'smbus':
+        if smbus is None:
+            raise ImportError('\'smbus\' backend requires the smbus package')
+        bus = smbus.SMBus(bus_id)
+        I2C.set_bus_timeout(bus_id, options.get('timeout', I2C.DEFAULT_BUS_TIMEOUT))
+        return bus
+    elif backend == 'smbus2':
+        if smbus2 is None:
+            raise ImportError('\'smbus2\' backend requires the smbus2 package')
+        bus = smbus2.SMBus(bus_id)
+        I2C.set_bus_timeout(bus_id, options.get('timeout', I2C.DEFAULT_BUS_TIMEOUT))
+        return bus
+    elif backend == 'emulator':
+        import smbus_emulator
+        return smbus_emulator.get_bus(bus_id, **options)
+    raise ValueError(f'Unknown bus backend \'{backend}\'')
+
+PROFILE_KEYS = [
+    'clock_source',
+    'dlpf_mode',
+    'rate',
+    'full_scale_accel_range',
+    'full_scale_gyro_range',
+    'accel_fifo_enabled',
+    'x_gyro_fifo_enabled',
+    'y_gyro_fifo_enabled',
+    'z_gyro_fifo_enabled']
+
+def compile_profile(settings):
+    for key in PROFILE_KEYS:
+        if key not in settings:
+            raise ValueError(f'Profile setting \'{key}\' is missing')
+    if settings['rate'] > 255 or settings['rate'] < 0:
+        raise ValueError('\'rate\' must be in range from 0 to 255')
+    # SMPLRT_DIV..FIFO_EN image; motion detection registers in between stay zeroed as after reset()
+    block = [0] * (MPU6050_RA_FIFO_EN - MPU6050_RA_SMPLRT_DIV + 1)
+    block[0] = settings['rate']
+    block[MPU6050_RA_CONFIG - MPU6050_RA_SMPLRT_DIV] = I2C.set_bits(
+        0, MPU6050_CFG_DLPF_CFG_BIT, MPU6050_CFG_DLPF_CFG_LENGTH, settings['dlpf_mode'])
+    block[MPU6050_RA_GYRO_CONFIG - MPU6050_RA_SMPLRT_DIV] = I2C.set_bits(
+        0, MPU6050_GCONFIG_FS_SEL_BIT, MPU6050_GCONFIG_FS_SEL_LENGTH, settings['full_scale_gyro_range'])
+    block[MPU6050_RA_ACCEL_CONFIG - MPU6050_RA_SMPLRT_DIV] = I2C.set_bits(
+        0, MPU6050_ACONFIG_AFS_SEL_BIT, MPU6050_ACONFIG_AFS_SEL_LENGTH, settings['full_scale_accel_range'])
+    fifo_en = 0
+    for key, bit in [('accel_fifo_enabled', MPU6050_ACCEL_FIFO_EN_BIT), ('x_gyro_fifo_enabled', MPU6050_XG_FIFO_EN_BIT),
+                     ('y_gyro_fifo_enabled', MPU6050_YG_FIFO_EN_BIT), ('z_gyro_fifo_enabled', MPU6050_ZG_FIFO_EN_BIT)]:
+        fifo_en = I2C.set_bit(fifo_en, bit, int(bool(settings[key])))
+    block[-1] = fifo_en
+    return {
+        'settings': {key: settings[key] for key in PROFILE_KEYS},
+        'block': block,
+        'power_management': I2C.set_bits(0, MPU6050_PWR1_CLKSEL_BIT, MPU6050_PWR1_CLKSEL_LENGTH, settings['clock_source'])
+    }
+
+def message_view(message):
+    if isinstance(message.buf, bytearray):
+        return memoryview(message.buf)
+    array = (ctypes.c_char * message.len).from_address(ctypes.addressof(message.buf.contents))
+    return memoryview(array).cast('B')
+
+class FifoReader:
+    # Session hot path: no argument checks, reads land in self.view, which is allocated once, and return the length
+    # read so the caller copies straight from it. The block path still gets a list per block from the smbus API.
+    # Hung transfers are bounded by the adapter timeout set in open_bus.
+    def __init__(self, bus, address, i2c_msg=None, user_ctrl=1 << MPU6050_USERCTRL_FIFO_EN_BIT):
+        self.address = address
+        self._write_byte = bus.write_byte_data
+        self._fifo_reset = user_ctrl | (1 << MPU6050_USERCTRL_FIFO_RESET_BIT)
+        self.buffer = bytearray(MPU6050_FIFO_SIZE)
+        self.view = memoryview(self.buffer)
+        if i2c_msg is not None:
+            self._rdwr = bus.i2c_rdwr
+            self._count_write = i2c_msg.write(address, [MPU6050_RA_FIFO_COUNTH])
+            self._count_read = i2c_msg.read(address, 2)
+            self._count_view = message_view(self._count_read)
+            self._data_write = i2c_msg.write(address, [MPU6050_RA_FIFO_R_W])
+            self._data_read = i2c_msg.read(address, MPU6050_FIFO_SIZE)
+            self.view = message_view(self._data_read)
+            self.read_count = self._read_count_rdwr
+            self.read_data = self._read_data_rdwr
+        else:
+            self._read_block = bus.read_i2c_block_data
+            self.read_count = self._read_count_block
+            self.read_data = self._read_data_block
+
+    def reset(self):
+        self._write_byte(self.address, MPU6050_RA_USER_CTRL, self._fifo_reset)
+
+    def _read_count_rdwr(self):
+        self._rdwr(self._count_write, self._count_read)
+        view = self._count_view
+        return (view[0] << 8) | view[1]
+
+    def _read_data_rdwr(self, length):
+        self._data_read.len = length
+        self._rdwr(self._data_write, self._data_read)
+        return length
+
+    def _read_count_block(self):
+        high, low = self._read_block(self.address, MPU6050_RA_FIFO_COUNTH, 2)
+        return (high << 8) | low
+
+    def _read_data_block(self, length):
+        read_block = self._read_block
+        address = self.address
+        buffer = self.buffer
+        position = 0
+        while position < length:
+            n = min(I2C.MAX_BLOCK_LENGTH, length - position)
+            buffer[position : position + n] = read_block(address, MPU6050_RA_FIFO_R_W, n)
+            position += n
+        return length
+
+def get_i2c_msg(bus, backend):
+    if backend == 'smbus2':
+        return smbus2.i2c_msg
+    return getattr(bus, 'i2c_msg', None)
+
 class MPU6050_Base:
     ZERO_REGISTER = [
         MPU6050_RA_FF_THR,
@@ -424,11 +554,108 @@ class MPU6050_Base:
         MPU6050_RA_I2C_MST_DELAY_CTRL,
         MPU6050_RA_SIGNAL_PATH_RESET,
         MPU6050_RA_MOT_DETECT_CTRL]
+    SHADOW_BLOCKS = [
+        (MPU6050_RA_XA_OFFS_H, 6),
+        (MPU6050_RA_XG_OFFS_USRH, 6),
+        (MPU6050_RA_SMPLRT_DIV, 4),
+        (MPU6050_RA_FIFO_EN, 1),
+        (MPU6050_RA_USER_CTRL, 2)]
+    SHADOW_REGISTERS = frozenset(reg + i for reg, length in SHADOW_BLOCKS for i in range(length))
+    USER_CTRL_SELF_CLEARING = ((1 << MPU6050_USERCTRL_FIFO_RESET_BIT) | (1 << MPU6050_USERCTRL_I2C_MST_RESET_BIT)
+                               | (1 << MPU6050_USERCTRL_SIG_COND_RESET_BIT) | (1 << MPU6050_USERCTRL_DMP_RESET_BIT))
     
-    def __init__(self, bus_id, address=MPU6050_DEFAULT_ADDRESS):
+    def __init__(self, bus_id, address=MPU6050_DEFAULT_ADDRESS, backend='smbus', backend_options=None, shadow=False):
         self.bus_id = bus_id
         self.address = address
-        self._bus = smbus.SMBus(self.bus_id)
+        self._bus = open_bus(self.bus_id, backend, **(backend_options or {}))
+        self._i2c_msg = get_i2c_msg(self._bus, backend)
+        self._shadow = {} if shadow else None
+
+    def invalidate_shadow(self):
+        if self._shadow is not None:
+            self._shadow.clear()
+
+    def sync_shadow(self):
+        if self._shadow is None:
+            return
+        self._shadow.clear()
+        for reg, length in self.SHADOW_BLOCKS:
+            for i, value in enumerate(I2C.read_bytes(self._bus, self.address, reg, length)):
+                self._store_register(reg + i, value)
+
+    def _store_register(self, reg, value):
+        if reg == MPU6050_RA_USER_CTRL:
+            value &= ~self.USER_CTRL_SELF_CLEARING
+        self._shadow[reg] = value
+
+    def _is_shadowed(self, reg):
+        return self._shadow is not None and reg in self.SHADOW_REGISTERS
+
+    def _read_register(self, reg):
+        if not self._is_shadowed(reg):
+            return I2C.read_byte(self._bus, self.address, reg)
+        if reg not in self._shadow:
+            self._store_register(reg, I2C.read_byte(self._bus, self.address, reg))
+        return self._shadow[reg]
+
+    def _write_register(self, reg, value):
+        I2C.write_byte(self._bus, self.address, reg, value)
+        if not self._is_shadowed(reg):
+            return
+        if reg == MPU6050_RA_PWR_MGMT_1 and value & (1 << MPU6050_PWR1_DEVICE_RESET_BIT):
+            self._shadow.clear()
+        else:
+            self._store_register(reg, value)
+
+    def _read_bit(self, reg, bit):
+        if not self._is_shadowed(reg):
+            return I2C.read_bit(self._bus, self.address, reg, bit)
+        I2C.check_bits(bit, 1)
+        return I2C.get_bit(self._read_register(reg), bit)
+
+    def _read_bits(self, reg, bit, length):
+        if not self._is_shadowed(reg):
+            return I2C.read_bits(self._bus, self.address, reg, bit, length)
+        I2C.check_bits(bit, length)
+        return I2C.get_bits(self._read_register(reg), bit, length)
+
+    def _write_bit(self, reg, bit, value):
+        if not self._is_shadowed(reg):
+            return I2C.write_bit(self._bus, self.address, reg, bit, value)
+        I2C.check_bits(bit, 1)
+        I2C.check_bit_value(value)
+        self._write_register(reg, I2C.set_bit(self._read_register(reg), bit, value))
+
+    def _write_bits(self, reg, bit, length, value):
+        if not self._is_shadowed(reg):
+            return I2C.write_bits(self._bus, self.address, reg, bit, length, value)
+        I2C.check_bits(bit, length)
+        I2C.check_bits_value(length, value)
+        self._write_register(reg, I2C.set_bits(self._read_register(reg), bit, length, value))
+
+    def _write_block(self, reg, values):
+        I2C.write_bytes(self._bus, self.address, reg, values)
+        for i, value in enumerate(values):
+            if self._is_shadowed(reg + i):
+                self._store_register(reg + i, value)
+
+    def _read_signed_word(self, reg):
+        if not self._is_shadowed(reg):
+            return I2C.read_signed_word(self._bus, self.address, reg)
+        if reg not in self._shadow or reg + 1 not in self._shadow:
+            buffer = I2C.read_bytes(self._bus, self.address, reg, 2)
+            self._store_register(reg, buffer[0])
+            self._store_register(reg + 1, buffer[1])
+        result = (self._shadow[reg] << 8) + self._shadow[reg + 1]
+        if result >= 0x8000:
+            return result - 65536
+        return result
+
+    def _write_signed_word(self, reg, value):
+        I2C.write_signed_word(self._bus, self.address, reg, value)
+        if self._is_shadowed(reg):
+            self._store_register(reg, (value >> 8) & 0xFF)
+            self._store_register(reg + 1, value & 0xFF)
 
     def test_connection(self):
         try:
@@ -437,80 +664,84 @@ class MPU6050_Base:
             return False
     
     def get_device_id(self):
-        return I2C.read_bits(self._bus, self.address, MPU6050_RA_WHO_AM_I, MPU6050_WHO_AM_I_BIT, MPU6050_WHO_AM_I_LENGTH)
+        return self._read_bits(MPU6050_RA_WHO_AM_I, MPU6050_WHO_AM_I_BIT, MPU6050_WHO_AM_I_LENGTH)
           
+    def write_profile(self, profile):
+        self._write_block(MPU6050_RA_SMPLRT_DIV, profile['block'])
+        self._write_register(MPU6050_RA_PWR_MGMT_1, profile['power_management'])
+
     def get_rate(self):
-        return I2C.read_byte(self._bus, self.address, MPU6050_RA_SMPLRT_DIV)
+        return self._read_register(MPU6050_RA_SMPLRT_DIV)
 
     def set_rate(self, rate):
-        I2C.write_byte(self._bus, self.address, MPU6050_RA_SMPLRT_DIV, rate)
+        self._write_register(MPU6050_RA_SMPLRT_DIV, rate)
     
     def get_clock_source(self):
-        return I2C.read_bits(self._bus, self.address, MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_CLKSEL_BIT, MPU6050_PWR1_CLKSEL_LENGTH)
+        return self._read_bits(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_CLKSEL_BIT, MPU6050_PWR1_CLKSEL_LENGTH)
     
     def set_clock_source(self, source):
-        I2C.write_bits(self._bus, self.address, MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_CLKSEL_BIT, MPU6050_PWR1_CLKSEL_LENGTH, source)
+        self._write_bits(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_CLKSEL_BIT, MPU6050_PWR1_CLKSEL_LENGTH, source)
     
     def get_full_scale_gyro_range(self):
-        return I2C.read_bits(self._bus, self.address, MPU6050_RA_GYRO_CONFIG, MPU6050_GCONFIG_FS_SEL_BIT, MPU6050_GCONFIG_FS_SEL_LENGTH)
+        return self._read_bits(MPU6050_RA_GYRO_CONFIG, MPU6050_GCONFIG_FS_SEL_BIT, MPU6050_GCONFIG_FS_SEL_LENGTH)
     
     def set_full_scale_gyro_range(self, range):
-        I2C.write_bits(self._bus, self.address, MPU6050_RA_GYRO_CONFIG, MPU6050_GCONFIG_FS_SEL_BIT, MPU6050_GCONFIG_FS_SEL_LENGTH, range)
+        self._write_bits(MPU6050_RA_GYRO_CONFIG, MPU6050_GCONFIG_FS_SEL_BIT, MPU6050_GCONFIG_FS_SEL_LENGTH, range)
         
     def get_full_scale_accel_range(self):
-        return I2C.read_bits(self._bus, self.address, MPU6050_RA_ACCEL_CONFIG, MPU6050_ACONFIG_AFS_SEL_BIT, MPU6050_ACONFIG_AFS_SEL_LENGTH)
+        return self._read_bits(MPU6050_RA_ACCEL_CONFIG, MPU6050_ACONFIG_AFS_SEL_BIT, MPU6050_ACONFIG_AFS_SEL_LENGTH)
     
     def set_full_scale_accel_range(self, range):
-        I2C.write_bits(self._bus, self.address, MPU6050_RA_ACCEL_CONFIG, MPU6050_ACONFIG_AFS_SEL_BIT, MPU6050_ACONFIG_AFS_SEL_LENGTH, range)
+        self._write_bits(MPU6050_RA_ACCEL_CONFIG, MPU6050_ACONFIG_AFS_SEL_BIT, MPU6050_ACONFIG_AFS_SEL_LENGTH, range)
         
     def get_sleep_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_SLEEP_BIT)
+        return self._read_bit(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_SLEEP_BIT)
     
     def set_sleep_enabled(self, enabled):
-        I2C.write_bits(self._bus, self.address, MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_SLEEP_BIT, 1, enabled)
+        self._write_bits(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_SLEEP_BIT, 1, enabled)
         
     def get_dlpf_mode(self):
-        return I2C.read_bits(self._bus, self.address, MPU6050_RA_CONFIG, MPU6050_CFG_DLPF_CFG_BIT, MPU6050_CFG_DLPF_CFG_LENGTH)
+        return self._read_bits(MPU6050_RA_CONFIG, MPU6050_CFG_DLPF_CFG_BIT, MPU6050_CFG_DLPF_CFG_LENGTH)
 
     def set_dlpf_mode(self, mode):
-        I2C.write_bits(self._bus, self.address, MPU6050_RA_CONFIG, MPU6050_CFG_DLPF_CFG_BIT, MPU6050_CFG_DLPF_CFG_LENGTH, mode)
+        self._write_bits(MPU6050_RA_CONFIG, MPU6050_CFG_DLPF_CFG_BIT, MPU6050_CFG_DLPF_CFG_LENGTH, mode)
     
     def get_temp_sensor_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_TEMP_DIS_BIT) == 0 # 1 is actually disabled here
+        return self._read_bit(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_TEMP_DIS_BIT) == 0 # 1 is actually disabled here
 
     def set_temp_sensor_enabled(self, enabled):
         # 1 is actually disabled here
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_TEMP_DIS_BIT, not enabled)
+        self._write_bit(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_TEMP_DIS_BIT, not enabled)
     
     def get_temp_fifo_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_TEMP_FIFO_EN_BIT)
+        return self._read_bit(MPU6050_RA_FIFO_EN, MPU6050_TEMP_FIFO_EN_BIT)
 
     def set_temp_fifo_enabled(self, enabled):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_TEMP_FIFO_EN_BIT, enabled)
+        self._write_bit(MPU6050_RA_FIFO_EN, MPU6050_TEMP_FIFO_EN_BIT, enabled)
 
     def get_x_gyro_fifo_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_XG_FIFO_EN_BIT)
+        return self._read_bit(MPU6050_RA_FIFO_EN, MPU6050_XG_FIFO_EN_BIT)
 
     def set_x_gyro_fifo_enabled(self, enabled):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_XG_FIFO_EN_BIT, enabled)
+        self._write_bit(MPU6050_RA_FIFO_EN, MPU6050_XG_FIFO_EN_BIT, enabled)
 
     def get_y_gyro_fifo_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_YG_FIFO_EN_BIT)
+        return self._read_bit(MPU6050_RA_FIFO_EN, MPU6050_YG_FIFO_EN_BIT)
 
     def set_y_gyro_fifo_enabled(self, enabled):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_YG_FIFO_EN_BIT, enabled)
+        self._write_bit(MPU6050_RA_FIFO_EN, MPU6050_YG_FIFO_EN_BIT, enabled)
 
     def get_z_gyro_fifo_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_ZG_FIFO_EN_BIT)
+        return self._read_bit(MPU6050_RA_FIFO_EN, MPU6050_ZG_FIFO_EN_BIT)
 
     def set_z_gyro_fifo_enabled(self, enabled):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_ZG_FIFO_EN_BIT, enabled)
+        self._write_bit(MPU6050_RA_FIFO_EN, MPU6050_ZG_FIFO_EN_BIT, enabled)
 
     def get_accel_fifo_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_ACCEL_FIFO_EN_BIT)
+        return self._read_bit(MPU6050_RA_FIFO_EN, MPU6050_ACCEL_FIFO_EN_BIT)
 
     def set_accel_fifo_enabled(self, enabled):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_FIFO_EN, MPU6050_ACCEL_FIFO_EN_BIT, enabled)
+        self._write_bit(MPU6050_RA_FIFO_EN, MPU6050_ACCEL_FIFO_EN_BIT, enabled)
 
     def get_motion_6(self):
         buffer = I2C.read_bytes(self._bus, self.address, MPU6050_RA_ACCEL_XOUT_H, 14)
@@ -552,19 +783,19 @@ class MPU6050_Base:
         return I2C.read_signed_word(self._bus, self.address, MPU6050_RA_GYRO_ZOUT_H)
 
     def get_fifo_enabled(self):
-        return I2C.read_bit(self._bus, self.address, MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_FIFO_EN_BIT)
+        return self._read_bit(MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_FIFO_EN_BIT)
 
     def set_fifo_enabled(self, enabled):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_FIFO_EN_BIT, enabled)
+        self._write_bit(MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_FIFO_EN_BIT, enabled)
         
     def reset_fifo(self):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_FIFO_RESET_BIT, True)
+        self._write_bit(MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_FIFO_RESET_BIT, True)
 
     def reset_sensors(self):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_SIG_COND_RESET_BIT, True)
+        self._write_bit(MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_SIG_COND_RESET_BIT, True)
 
     def reset(self):
-        I2C.write_bit(self._bus, self.address, MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_DEVICE_RESET_BIT, True)
+        self._write_bit(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_DEVICE_RESET_BIT, True)
         for reg in self.ZERO_REGISTER:
             I2C.write_byte(self._bus, self.address, reg, 0)
 
@@ -575,49 +806,56 @@ class MPU6050_Base:
     def get_fifo_byte(self):
         return I2C.read_byte(self._bus, self.address, MPU6050_RA_FIFO_R_W)
 
+    def get_fifo_reader(self):
+        user_ctrl = self._read_register(MPU6050_RA_USER_CTRL) & ~self.USER_CTRL_SELF_CLEARING
+        return FifoReader(self._bus, self.address, self._i2c_msg, user_ctrl)
+
     def get_fifo_bytes(self, length):
-        return I2C.read_bytes(self._bus, self.address, MPU6050_RA_FIFO_R_W, length)
+        if length <= I2C.MAX_BLOCK_LENGTH:
+            return I2C.read_bytes(self._bus, self.address, MPU6050_RA_FIFO_R_W, length)
+        return I2C.read_long_bytes(self._bus, self.address, MPU6050_RA_FIFO_R_W, length, self._i2c_msg)
     
     def get_accel_offset_x(self):
-        return I2C.read_signed_word(self._bus, self.address, MPU6050_RA_XA_OFFS_H)
+        return self._read_signed_word(MPU6050_RA_XA_OFFS_H)
     
     def set_accel_offset_x(self, offset):
-        return I2C.write_signed_word(self._bus, self.address, MPU6050_RA_XA_OFFS_H, offset)
+        return self._write_signed_word(MPU6050_RA_XA_OFFS_H, offset)
     
     def get_accel_offset_y(self):
-        return I2C.read_signed_word(self._bus, self.address, MPU6050_RA_YA_OFFS_H)
+        return self._read_signed_word(MPU6050_RA_YA_OFFS_H)
     
     def set_accel_offset_y(self, offset):
-        return I2C.write_signed_word(self._bus, self.address, MPU6050_RA_YA_OFFS_H, offset)
+        return self._write_signed_word(MPU6050_RA_YA_OFFS_H, offset)
     
     def get_accel_offset_z(self):
-        return I2C.read_signed_word(self._bus, self.address, MPU6050_RA_ZA_OFFS_H)
+        return self._read_signed_word(MPU6050_RA_ZA_OFFS_H)
     
     def set_accel_offset_z(self, offset):
-        return I2C.write_signed_word(self._bus, self.address, MPU6050_RA_ZA_OFFS_H, offset)
+        return self._write_signed_word(MPU6050_RA_ZA_OFFS_H, offset)
     
     def get_gyro_offset_x(self):
-        return I2C.read_signed_word(self._bus, self.address, MPU6050_RA_XG_OFFS_USRH)
+        return self._read_signed_word(MPU6050_RA_XG_OFFS_USRH)
     
     def set_gyro_offset_x(self, offset):
-        return I2C.write_signed_word(self._bus, self.address, MPU6050_RA_XG_OFFS_USRH, offset)
+        return self._write_signed_word(MPU6050_RA_XG_OFFS_USRH, offset)
     
     def get_gyro_offset_y(self):
-        return I2C.read_signed_word(self._bus, self.address, MPU6050_RA_YG_OFFS_USRH)
+        return self._read_signed_word(MPU6050_RA_YG_OFFS_USRH)
     
     def set_gyro_offset_y(self, offset):
-        return I2C.write_signed_word(self._bus, self.address, MPU6050_RA_YG_OFFS_USRH, offset)
+        return self._write_signed_word(MPU6050_RA_YG_OFFS_USRH, offset)
     
     def get_gyro_offset_z(self):
-        return I2C.read_signed_word(self._bus, self.address, MPU6050_RA_ZG_OFFS_USRH)
+        return self._read_signed_word(MPU6050_RA_ZG_OFFS_USRH)
     
     def set_gyro_offset_z(self, offset):
-        return I2C.write_signed_word(self._bus, self.address, MPU6050_RA_ZG_OFFS_USRH, offset)
+        return self._write_signed_word(MPU6050_RA_ZG_OFFS_USRH, offset)
     
 class MPU6050:
-    def __init__(self, sensor_id, bus_id, address=MPU6050_DEFAULT_ADDRESS):
+    def __init__(self, sensor_id, bus_id, address=MPU6050_DEFAULT_ADDRESS, backend='smbus', backend_options=None, shadow=False):
         self.id = sensor_id
-        self._mpu6050 = MPU6050_Base(bus_id, address)
+        self._mpu6050 = MPU6050_Base(bus_id, address, backend, backend_options, shadow)
+        self._mpu6050.sync_shadow()
         self._mpu6050.set_sleep_enabled(False)
         self._mpu6050.set_fifo_enabled(True)
         self._accel_fifo_enabled = self._mpu6050.get_accel_fifo_enabled()
@@ -634,6 +872,10 @@ class MPU6050:
         else:
             self._gyro_output_rate = MPU6050_DLPF_GYRO_OUTPUT_RATE
     
+    @property
+    def bus_id(self):
+        return self._mpu6050.bus_id
+    
     def reset(self):
         self._mpu6050.reset()
         self._mpu6050.set_sleep_enabled(False)
@@ -649,6 +891,23 @@ class MPU6050:
         self._rate = 0
         self._gyro_output_rate = MPU6050_DEFAULT_GYRO_OUTPUT_RATE
     
+    def apply_profile(self, profile):
+        self._mpu6050.write_profile(profile)
+        settings = profile['settings']
+        self._clock_source = settings['clock_source']
+        self._rate = settings['rate']
+        self._full_scale_accel_range = settings['full_scale_accel_range']
+        self._full_scale_gyro_range = settings['full_scale_gyro_range']
+        self._accel_fifo_enabled = bool(settings['accel_fifo_enabled'])
+        self._x_gyro_fifo_enabled = bool(settings['x_gyro_fifo_enabled'])
+        self._y_gyro_fifo_enabled = bool(settings['y_gyro_fifo_enabled'])
+        self._z_gyro_fifo_enabled = bool(settings['z_gyro_fifo_enabled'])
+        self._dlpf_mode = settings['dlpf_mode']
+        if self._dlpf_mode == MPU6050_DLPF_BW_256:
+            self._gyro_output_rate = MPU6050_DEFAULT_GYRO_OUTPUT_RATE
+        else:
+            self._gyro_output_rate = MPU6050_DLPF_GYRO_OUTPUT_RATE
+    
     @staticmethod
     def accel_range_to_factor(range_):
         if range_ == MPU6050_ACCEL_FS_2:
@@ -817,6 +1076,9 @@ class MPU6050:
             package_byte_length += 2
         return package_byte_length
     
+    def sync_shadow(self):
+        self._mpu6050.sync_shadow()
+    
     def get_fifo_count(self):
         return self._mpu6050.get_fifo_count()
 
@@ -826,5 +1088,8 @@ class MPU6050:
     def get_fifo_bytes(self, length):
         return self._mpu6050.get_fifo_bytes(length)
     
+    def get_fifo_reader(self):
+        return self._mpu6050.get_fifo_reader()
+    
     def reset_fifo(self):
         self._mpu6050.reset_fifo()
\ No newline at end of file
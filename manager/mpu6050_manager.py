@@ -1,19 +1,32 @@
-from mpu6050 import MPU6050
+from mpu6050 import MPU6050, compile_profile
+from fifo_scheduler import FifoScheduler, DEFAULT_WATERMARK, DEFAULT_MAX_INTERVAL
+from session_writer import SessionWriter, DEFAULT_BUFFER_SIZE, DEFAULT_FLUSH_SIZE, DEFAULT_FLUSH_INTERVAL
 from contextlib import ExitStack
+import queue
 import struct
+import threading
 import yaml
 import os
 import time
 
+DEFAULT_ANCHOR_INTERVAL = 1.0
+MAX_START_DELAY = 60
+ANCHOR_FORMAT = '<dQ'
+ANCHOR_SIZE = struct.calcsize(ANCHOR_FORMAT)
+
 class MPU6050_Manager: 
-    def __init__(self, controller_id, sensor_ids, bus_ids, addresses=None):
+    def __init__(self, controller_id, sensor_ids, bus_ids, addresses=None, backend='smbus', backend_options=None, shadow=False,
+                 profiles=None):
         self.controller_id = controller_id
         self.sensors = {}
+        self.profiles = {}
+        for name, settings in (profiles or {}).items():
+            self.add_profile(name, settings)
         for i in range(len(sensor_ids)):
             if addresses: 
-                sensor = MPU6050(sensor_ids[i], bus_ids[i], addresses[i])
+                sensor = MPU6050(sensor_ids[i], bus_ids[i], addresses[i], backend, backend_options, shadow)
             else: 
-                sensor = MPU6050(sensor_ids[i], bus_ids[i])
+                sensor = MPU6050(sensor_ids[i], bus_ids[i], backend=backend, backend_options=backend_options, shadow=shadow)
             self.sensors[sensor_ids[i]] = sensor
     
     def reset_sensor(self, sensor_id):
@@ -22,25 +35,55 @@ class MPU6050_Manager:
     def reset_sensors(self):
         for sensor in self.sensors.values():
             sensor.reset()
+    
+    def sync_shadows(self):
+        for sensor in self.sensors.values():
+            sensor.sync_shadow()
+            
+    def add_profile(self, name, settings):
+        self.profiles[name] = compile_profile(settings)
+    
+    def apply_profile(self, name, sensor_ids=None):
+        if name not in self.profiles:
+            raise ValueError(f'Unknown profile \'{name}\'')
+        if sensor_ids is None:
+            sensor_ids = list(self.sensors.keys())
+        for sensor_id in sensor_ids:
+            if sensor_id not in self.sensors:
+                raise ValueError(f'Unknown sensor \'{sensor_id}\'')
+        for sensor_id in sensor_ids:
+            self.sensors[sensor_id].apply_profile(self.profiles[name])
             
     def configurate_sensor(self, sensor_id, clock_source, dlpf_mode, rate, full_scale_accel_range, full_scale_gyro_range,
                             accel_fifo_enabled, x_gyro_fifo_enabled, y_gyro_fifo_enabled, z_gyro_fifo_enabled):
-        sensor = self.sensors[sensor_id]
-        sensor.clock_source = clock_source
-        sensor.dlpf_mode = dlpf_mode
-        sensor.rate = rate
-        sensor.full_scale_accel_range = full_scale_accel_range
-        sensor.full_scale_gyro_range = full_scale_gyro_range
-        sensor.accel_fifo_enabled = accel_fifo_enabled
-        sensor.x_gyro_fifo_enabled = x_gyro_fifo_enabled
-        sensor.y_gyro_fifo_enabled = y_gyro_fifo_enabled
-        sensor.z_gyro_fifo_enabled = z_gyro_fifo_enabled
+        profile = compile_profile({
+            'clock_source': clock_source,
+            'dlpf_mode': dlpf_mode,
+            'rate': rate,
+            'full_scale_accel_range': full_scale_accel_range,
+            'full_scale_gyro_range': full_scale_gyro_range,
+            'accel_fifo_enabled': accel_fifo_enabled,
+            'x_gyro_fifo_enabled': x_gyro_fifo_enabled,
+            'y_gyro_fifo_enabled': y_gyro_fifo_enabled,
+            'z_gyro_fifo_enabled': z_gyro_fifo_enabled
+        })
+        self.sensors[sensor_id].apply_profile(profile)
     
     def configurate_sensors(self, clock_source, dlpf_mode, rate, full_scale_accel_range, full_scale_gyro_range,
                             accel_fifo_enabled, x_gyro_fifo_enabled, y_gyro_fifo_enabled, z_gyro_fifo_enabled):
-        for sensor_id in self.sensors: 
-            self.configurate_sensor(sensor_id, clock_source, dlpf_mode, rate, full_scale_accel_range, full_scale_gyro_range,
-                            accel_fifo_enabled, x_gyro_fifo_enabled, y_gyro_fifo_enabled, z_gyro_fifo_enabled)
+        profile = compile_profile({
+            'clock_source': clock_source,
+            'dlpf_mode': dlpf_mode,
+            'rate': rate,
+            'full_scale_accel_range': full_scale_accel_range,
+            'full_scale_gyro_range': full_scale_gyro_range,
+            'accel_fifo_enabled': accel_fifo_enabled,
+            'x_gyro_fifo_enabled': x_gyro_fifo_enabled,
+            'y_gyro_fifo_enabled': y_gyro_fifo_enabled,
+            'z_gyro_fifo_enabled': z_gyro_fifo_enabled
+        })
+        for sensor in self.sensors.values():
+            sensor.apply_profile(profile)
             
     def get_temperature(self, sensor_id):
         return self.sensors[sensor_id].get_temperature()
@@ -58,7 +101,94 @@ class MPU6050_Manager:
         for sensor in self.sensors.values():
             sensor.calibrate(max_iters, rough_iters, buffer_size, epsilon, mu, v_threshold)
     
-    def start_session(self, session_name, duration):
+    def _read_bus(self, sensors, readers, package_length, clock_start, duration, watermark, max_interval, writer, output, stop,
+                  overflows, gaps, anchors, anchor_interval, feed):
+        # Reader thread for a single bus: services its sensors on FIFO deadlines and pushes packages to the writer
+        scheduler = FifoScheduler(watermark, max_interval)
+        try:
+            positions = {i: 0 for i in sensors}
+            timeline = {i: 0 for i in sensors}
+            last_read = {i: clock_start for i in sensors}
+            next_anchor = {i: clock_start for i in sensors}
+            pack_anchor = struct.Struct(ANCHOR_FORMAT).pack
+            for i, sensor in sensors.items():
+                scheduler.add(i, sensor.sample_rate * package_length[i])
+            scheduler.start(clock_start)
+            time_end = clock_start + duration
+            # deadlines run on the monotonic clock, anchors record host time for merge
+            clock, host_clock, wait, is_stopped = time.monotonic, time.time, stop.wait, stop.is_set
+            next_due, pop, update, push = scheduler.next_due, scheduler.pop, scheduler.update, writer.push
+            while not is_stopped():
+                now = clock()
+                if now >= time_end:
+                    break
+                due = next_due()
+                if due > now:
+                    wait(min(due, time_end) - now)
+                    continue
+                i = pop()
+                reader = readers[i]
+                fifo_count = reader.read_count()
+                if fifo_count >= 1024 or fifo_count % package_length[i]:
+                    # FIFO dropped samples and may be misaligned: restart it and account the samples produced since the last read
+                    overflows[sensors[i].id].append(now - clock_start)
+                    # anchors at the last read and right after the reset let merge refit the gap length from host time
+                    anchors[i] += pack_anchor(host_clock() - (clock() - last_read[i]), timeline[i])
+                    reader.reset()
+                    reset_time = clock()
+                    host_reset_time = host_clock()
+                    gap_length = int(round((reset_time - last_read[i]) * sensors[i].sample_rate))
+                    gaps[sensors[i].id].append({
+                        'package': positions[i],
+                        'length': gap_length,
+                        'time': reset_time - clock_start,
+                        'anchor': len(anchors[i]) // ANCHOR_SIZE
+                    })
+                    timeline[i] += gap_length
+                    anchors[i] += pack_anchor(host_reset_time, timeline[i])
+                    last_read[i] = reset_time
+                    scheduler.reset(i, reset_time)
+                    continue
+                if fifo_count > 0:
+                    length = reader.read_data(fifo_count)
+                    timeline[i] += length // package_length[i]
+                    if push(i, reader.view, length):
+                        positions[i] += length // package_length[i]
+                        if feed:
+                            output.put((i, bytes(reader.view[:length])))
+                    else:
+                        gaps[sensors[i].id].append({
+                            'package': positions[i],
+                            'length': fifo_count // package_length[i],
+                            'time': now - clock_start
+                        })
+                if now >= next_anchor[i]:
+                    # (host time, samples produced so far) pairs let merge fit the true rate of the sensor clock
+                    anchors[i] += pack_anchor(host_clock(), timeline[i])
+                    next_anchor[i] = now + anchor_interval
+                last_read[i] = now
+                update(i, now, fifo_count, fifo_count)
+            # also drain after a stop request, a failing reader leaves through the exception handler
+            for i, reader in readers.items():
+                fifo_count = reader.read_count()
+                if 0 < fifo_count < 1024 and fifo_count % package_length[i] == 0:
+                    length = reader.read_data(fifo_count)
+                    timeline[i] += length // package_length[i]
+                    anchors[i] += pack_anchor(host_clock(), timeline[i])
+                    if push(i, reader.view, length) and feed:
+                        output.put((i, bytes(reader.view[:length])))
+        except Exception as e:
+            stop.set()
+            output.put(e)
+        finally:
+            output.put(scheduler)
+
+    def start_session(self, session_name, duration, live_orientation=None, watermark=DEFAULT_WATERMARK,
+                      max_interval=DEFAULT_MAX_INTERVAL, buffer_size=DEFAULT_BUFFER_SIZE, flush_size=DEFAULT_FLUSH_SIZE,
+                      flush_interval=DEFAULT_FLUSH_INTERVAL, anchor_interval=DEFAULT_ANCHOR_INTERVAL, start_time=None,
+                      stop=None, on_start=None, stream=None):
+        if start_time is not None and start_time - time.time() > MAX_START_DELAY:
+            raise ValueError(f'\'start_time\' must be within {MAX_START_DELAY} seconds from now')
         dir_path = session_name
         metadata_path = os.path.join(dir_path, 'metadata')
         raw_data_path = os.path.join(dir_path, 'raw_data')
@@ -73,11 +203,16 @@ class MPU6050_Manager:
         session_info['controller_id'] = self.controller_id
         session_info['time'] = {
             'start': None,
+            'scheduled_start': start_time,
+            'start_skew': None,
+            'reset_spread': None,
             'duration': duration
         }
         session_info['sensors'] = {}
         session_info['overflows'] = {}
+        session_info['gaps'] = {}
         session_info['files'] = {}
+        session_info['anchors'] = {}
         for sensor_id, sensor in self.sensors.items():
             session_info['sensors'][sensor_id] = {
                 'clock_source': sensor.clock_source,
@@ -95,29 +230,100 @@ class MPU6050_Manager:
                 'package_length':  sensor.package_length
             }
             session_info['overflows'][sensor_id] = []
+            session_info['gaps'][sensor_id] = []
             session_info['files'][sensor_id] = 'sensor_{}'.format(sensor_id)
+            session_info['anchors'][sensor_id] = 'anchors_{}'.format(sensor_id)
+            if live_orientation:
+                live_orientation.add_sensor(sensor)
         file_paths = list(map(lambda x:  os.path.join(raw_data_path, x), session_info['files'].values()))
         package_length = [sensor.package_length for sensor in self.sensors.values()]
-        packages_per_read = [(32 // length if length != 0 else 0) for length in package_length]
+        sensors = list(self.sensors.values())
+        buses = {}
+        for i, sensor in enumerate(sensors):
+            if package_length[i] > 0:
+                buses.setdefault(sensor.bus_id, {})[i] = sensor
+        fifo_readers = {i: sensor.get_fifo_reader()
+                        for bus_sensors in buses.values() for i, sensor in bus_sensors.items()}
         with ExitStack() as stack: 
             files = [stack.enter_context(open(fpath, 'wb')) for fpath in file_paths]
-            count = [0 for i in range(len(self.sensors))]
+            if stream:
+                files = [stream.wrap(f, fpath, f'raw_data/{file_name}')
+                         for f, fpath, file_name in zip(files, file_paths, session_info['files'].values())]
+            writer = SessionWriter(files, buffer_size, flush_size, flush_interval)
+            writer.start()
+            anchors = [bytearray() for _ in sensors]
+            output = queue.Queue()
+            if stop is None:
+                stop = threading.Event()
+            # Armed: everything but the FIFO resets is done, so the start deadline is only bounded by sleep precision
+            if start_time is not None:
+                stop.wait(max(start_time - time.time(), 0))
             time_start = time.time()
-            for sensor in self.sensors.values():
-                sensor.reset_fifo()
-            while time.time() - time_start < duration:
-                for i, sensor in enumerate(self.sensors.values()):
-                    if package_length[i] > 0: 
-                        fifo_count = sensor.get_fifo_count()
-                        if fifo_count == 1024: 
-                            session_info['overflows'][sensor.id].append(time.time() - time_start)
-                            print('!!!')
-                        if fifo_count > package_length[i] * packages_per_read[i]:
-                            package = sensor.get_fifo_bytes(package_length[i] * packages_per_read[i])
-                            files[i].write(bytes(package))
-                            count[i] += packages_per_read[i]
+            clock_start = time.monotonic()
+            for reader in fifo_readers.values():
+                reader.reset()
+            session_info['time']['reset_spread'] = time.monotonic() - clock_start
+            if start_time is not None:
+                session_info['time']['start_skew'] = time_start - start_time
+            if live_orientation:
+                live_orientation.start(time_start)
+            if on_start:
+                on_start(time_start)
+            readers = [threading.Thread(target=self._read_bus, name=f'bus_{bus_id}',
+                                        args=(bus_sensors, {i: fifo_readers[i] for i in bus_sensors}, package_length,
+                                              clock_start, duration, watermark, max_interval, writer, output, stop,
+                                              session_info['overflows'], session_info['gaps'], anchors, anchor_interval,
+                                              live_orientation is not None))
+                       for bus_id, bus_sensors in buses.items()]
+            for reader in readers:
+                reader.start()
+            schedulers = []
+            errors = []
+            try:
+                while len(schedulers) < len(readers):
+                    try:
+                        item = output.get(timeout=max_interval)
+                    except queue.Empty:
+                        item = None
+                    if isinstance(item, FifoScheduler):
+                        schedulers.append(item)
+                    elif isinstance(item, Exception):
+                        errors.append(item)
+                    elif item is not None:
+                        i, package = item
+                        live_orientation.feed(sensors[i].id, package)
+                    if writer.error is not None and not stop.is_set():
+                        stop.set()
+                    if live_orientation:
+                        live_orientation.poll(time.time())
+            finally:
+                stop.set()
+                for reader in readers:
+                    reader.join()
+                try:
+                    writer.close()
+                except Exception as e:
+                    errors.append(e)
+            count = [written // length if length else 0 for written, length in zip(writer.written, package_length)]
+        for file_name, data in zip(session_info['anchors'].values(), anchors):
+            with open(os.path.join(raw_data_path, file_name), 'wb') as f:
+                f.write(data)
         session_info['time']['start'] = time_start
         session_info['n_packages'] = dict(zip(list(self.sensors.keys()), count))
+        session_info['scheduler'] = {'buses': len(readers), 'services': 0, 'empty_services': 0, 'sample_rates': {}}
+        for scheduler in schedulers:
+            for key, value in scheduler.get_stats().items():
+                session_info['scheduler'][key] += value
+            for i, byte_rate in scheduler.byte_rates.items():
+                session_info['scheduler']['sample_rates'][sensors[i].id] = float(byte_rate / package_length[i])
+        session_info['writer'] = writer.get_stats(list(self.sensors.keys()))
+        if errors:
+            session_info['errors'] = [repr(e) for e in errors]
+        if live_orientation:
+            session_info['live_orientation'] = live_orientation.get_stats()
         session_info_path = os.path.join(metadata_path, f'{self.controller_id}_session_info.yml')
         with open(session_info_path, 'w') as f: 
-            yaml.dump(session_info, f, sort_keys=False)
\ No newline at end of file
+            yaml.dump(session_info, f, sort_keys=False)
+        if errors:
+            raise errors[0]
+        return session_info
\ No newline at end of file
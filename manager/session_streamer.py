@@ -0,0 +1,165 @@
+import hashlib
+import os
+import threading
+import time
+import requests
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_STREAM_INTERVAL = 0.5
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+CHECKSUM_BLOCK_SIZE = 1 << 20
+
+def get_checksum(local_path):
+    checksum = hashlib.sha256()
+    with open(local_path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_SIZE), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+class StreamFile:
+    # Local session file whose flushed bytes are picked up by the streamer thread
+    def __init__(self, f, entry):
+        self.f = f
+        self.entry = entry
+
+    def write(self, data):
+        length = self.f.write(data)
+        self.f.flush()
+        self.entry['written'] += len(data)
+        return length
+
+class SessionStreamer:
+    # Ships session files to the client while they are written, reading back from the page cache by offset.
+    # Every chunk carries its sha256 and is written by offset, so a retried chunk is idempotent. After a failure the
+    # acknowledged offsets are fetched from the client and sending resumes from there.
+    def __init__(self, url, session_name, chunk_size=DEFAULT_CHUNK_SIZE, interval=DEFAULT_STREAM_INTERVAL,
+                 timeout=DEFAULT_TIMEOUT, http=None):
+        self.url = url
+        self.session_name = session_name
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.timeout = timeout
+        self.http = http if http is not None else requests.Session()
+        self.entries = {}
+        self.n_requests = 0
+        self.n_failures = 0
+        self.bytes_sent = 0
+        self.max_pending = 0
+        self.error = None
+        self.closing = False
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='session_streamer', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def add_file(self, local_path, path, written=0):
+        self.entries[path] = {'local_path': local_path, 'written': written, 'sent': 0}
+        return self.entries[path]
+
+    def wrap(self, f, local_path, path):
+        return StreamFile(f, self.add_file(local_path, path))
+
+    def add_dir(self, session_dir):
+        # Adds the files written after recording (anchors, session_info) and files of a spooled session
+        paths = {}
+        for root, _, file_names in os.walk(session_dir):
+            for file_name in file_names:
+                local_path = os.path.join(root, file_name)
+                paths[os.path.relpath(local_path, session_dir).replace(os.sep, '/')] = local_path
+        # session_info goes last, the client treats its arrival as the end of the session part
+        for path in sorted(paths, key=lambda path: path.startswith('metadata/')):
+            if path not in self.entries:
+                self.add_file(paths[path], path, os.path.getsize(paths[path]))
+
+    def resume(self):
+        response = self.http.get(self.url, params={'session_name': self.session_name}, timeout=self.timeout)
+        self.n_requests += 1
+        response.raise_for_status()
+        sizes = response.json()['files']
+        for path, entry in self.entries.items():
+            entry['sent'] = min(sizes.get(path, 0), entry['written'])
+
+    def send_chunk(self, path, offset, data):
+        headers = {'Content-Type': 'application/octet-stream', 'X-Checksum': hashlib.sha256(data).hexdigest()}
+        response = self.http.post(self.url, params={'session_name': self.session_name, 'path': path, 'offset': offset},
+                                  data=data, headers=headers, timeout=self.timeout)
+        self.n_requests += 1
+        response.raise_for_status()
+        size = response.json()['size']
+        if size != offset + len(data):
+            raise ValueError(f'Client has {size} bytes of \'{path}\', expected {offset + len(data)}')
+
+    def send_pending(self):
+        pending = sum(entry['written'] - entry['sent'] for entry in self.entries.values())
+        self.max_pending = max(self.max_pending, pending)
+        for path, entry in list(self.entries.items()):
+            if entry['sent'] >= entry['written']:
+                continue
+            with open(entry['local_path'], 'rb') as f:
+                f.seek(entry['sent'])
+                while entry['sent'] < entry['written']:
+                    data = f.read(min(self.chunk_size, entry['written'] - entry['sent']))
+                    if not data:
+                        break
+                    self.send_chunk(path, entry['sent'], data)
+                    entry['sent'] += len(data)
+                    self.bytes_sent += len(data)
+
+    def commit(self):
+        # The client checks every file against its size and sha256, a rejected file is sent again from its offset
+        files = {path: {'size': entry['written'], 'sha256': get_checksum(entry['local_path'])}
+                 for path, entry in self.entries.items()}
+        response = self.http.post(f'{self.url}/commit', params={'session_name': self.session_name}, json=files,
+                                  timeout=self.timeout)
+        self.n_requests += 1
+        response.raise_for_status()
+        mismatched = response.json()['mismatched']
+        if mismatched:
+            raise ValueError(f'Client rejected {", ".join(mismatched)}')
+
+    def upload(self):
+        if self.error is not None:
+            self.resume()
+        self.send_pending()
+
+    def run(self):
+        while not self.closing:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.upload()
+                self.error = None
+            except Exception as e:
+                self.n_failures += 1
+                self.error = e
+
+    def close(self):
+        self.closing = True
+        self.wakeup.set()
+        self.thread.join()
+
+    def finish(self, session_dir, retries=DEFAULT_RETRIES):
+        self.close()
+        self.add_dir(session_dir)
+        for attempt in range(retries + 1):
+            try:
+                self.upload()
+                self.commit()
+                self.error = None
+                return
+            except Exception as e:
+                self.n_failures += 1
+                self.error = e
+                if attempt < retries:
+                    time.sleep(self.interval * (attempt + 1))
+        raise self.error
+
+    def get_stats(self):
+        return {
+            'requests': self.n_requests,
+            'failures': self.n_failures,
+            'bytes_sent': self.bytes_sent,
+            'max_pending': self.max_pending
+        }
\ No newline at end of file
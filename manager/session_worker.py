@@ -0,0 +1,57 @@
+import threading
+import time
+
+class SessionWorker:
+    # Runs one session job at a time off the MQTT network thread: idle -> armed -> recording -> uploading -> done/failed
+    def __init__(self, on_state=None):
+        self.on_state = on_state
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop = threading.Event()
+        self.session_name = None
+        self.state = 'idle'
+        self.state_time = time.time()
+        self.error = None
+
+    def is_busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def submit(self, session_name, job):
+        with self.lock:
+            if self.is_busy():
+                raise RuntimeError(f'Session \'{self.session_name}\' is {self.state}')
+            self.session_name = session_name
+            self.stop = threading.Event()
+            self.error = None
+            self.thread = threading.Thread(target=self.run, args=(job,), name='session_worker', daemon=True)
+            self.set_state('armed')
+            self.thread.start()
+
+    def run(self, job):
+        try:
+            job(self.stop, self.set_state)
+            self.set_state('done')
+        except Exception as e:
+            self.error = e
+            self.set_state('failed')
+
+    def set_state(self, state):
+        self.state = state
+        self.state_time = time.time()
+        if self.on_state:
+            self.on_state(self.get_status())
+
+    def request_stop(self):
+        if not self.is_busy():
+            return False
+        self.stop.set()
+        return True
+
+    def get_status(self):
+        return {
+            'session_name': self.session_name,
+            'state': self.state,
+            'since': self.state_time,
+            'stop_requested': self.stop.is_set(),
+            'error': None if self.error is None else str(self.error)
+        }
\ No newline at end of file
@@ -0,0 +1,124 @@
+import threading
+import time
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+DEFAULT_FLUSH_SIZE = 1 << 16
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+class RingBuffer:
+    # Single producer (bus reader) advances head, single consumer (writer) advances tail
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.head = 0
+        self.tail = 0
+
+    @property
+    def fill(self):
+        return self.head - self.tail
+
+    def put(self, data, length):
+        # copies data[:length], the reader passes its own preallocated buffer
+        if length > self.capacity - self.fill:
+            return False
+        start = self.head % self.capacity
+        first = min(length, self.capacity - start)
+        self.view[start : start + first] = data[:first]
+        if first < length:
+            self.view[: length - first] = data[first:length]
+        self.head += length
+        return True
+
+    def peek(self):
+        start = self.tail % self.capacity
+        length = self.fill
+        first = min(length, self.capacity - start)
+        segments = [self.view[start : start + first]]
+        if first < length:
+            segments.append(self.view[: length - first])
+        return segments
+
+    def consume(self, length):
+        self.tail += length
+
+class SessionWriter:
+    def __init__(self, files, buffer_size=DEFAULT_BUFFER_SIZE, flush_size=DEFAULT_FLUSH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.files = files
+        self.rings = [RingBuffer(buffer_size) for _ in files]
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.written = [0] * len(files)
+        self.max_fill = [0] * len(files)
+        self.dropped_chunks = [0] * len(files)
+        self.dropped_bytes = [0] * len(files)
+        self.n_writes = 0
+        self.max_write_time = 0
+        self.error = None
+        self.closing = False
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='session_writer')
+
+    def start(self):
+        self.thread.start()
+
+    def push(self, i, data, length):
+        ring = self.rings[i]
+        if not ring.put(data, length):
+            self.dropped_chunks[i] += 1
+            self.dropped_bytes[i] += length
+            return False
+        fill = ring.fill
+        if fill > self.max_fill[i]:
+            self.max_fill[i] = fill
+        if fill >= self.flush_size:
+            self.wakeup.set()
+        return True
+
+    def flush(self, i):
+        ring = self.rings[i]
+        length = 0
+        for segment in ring.peek():
+            if len(segment) == 0:
+                continue
+            time_start = time.perf_counter()
+            self.files[i].write(segment)
+            self.max_write_time = max(self.max_write_time, time.perf_counter() - time_start)
+            self.n_writes += 1
+            length += len(segment)
+        ring.consume(length)
+        self.written[i] += length
+
+    def run(self):
+        try:
+            last_flush = [time.monotonic()] * len(self.rings)
+            while not self.closing:
+                self.wakeup.wait(self.flush_interval)
+                self.wakeup.clear()
+                now = time.monotonic()
+                for i, ring in enumerate(self.rings):
+                    if ring.fill >= self.flush_size or (ring.fill and now - last_flush[i] >= self.flush_interval):
+                        self.flush(i)
+                        last_flush[i] = now
+            for i in range(len(self.rings)):
+                self.flush(i)
+        except Exception as e:
+            self.error = e
+
+    def close(self):
+        self.closing = True
+        self.wakeup.set()
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def get_stats(self, ids):
+        return {
+            'writes': self.n_writes,
+            'max_write_time': self.max_write_time,
+            'buffer_size': self.rings[0].capacity if self.rings else 0,
+            'max_fill': dict(zip(ids, self.max_fill)),
+            'dropped_chunks': dict(zip(ids, self.dropped_chunks)),
+            'dropped_bytes': dict(zip(ids, self.dropped_bytes))
+        }
\ No newline at end of file
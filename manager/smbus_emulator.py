@@ -0,0 +1,297 @@
+import errno
+import math
+import random
+import struct
+import threading
+import time
+from mpu6050 import (MPU6050_ACCEL_FIFO_EN_BIT, MPU6050_ACCEL_OFFSET_FACTOR, MPU6050_ACONFIG_AFS_SEL_BIT,
+                     MPU6050_ACONFIG_AFS_SEL_LENGTH, MPU6050_CFG_DLPF_CFG_BIT, MPU6050_CFG_DLPF_CFG_LENGTH,
+                     MPU6050_DEFAULT_GYRO_OUTPUT_RATE, MPU6050_DLPF_GYRO_OUTPUT_RATE, MPU6050_GCONFIG_FS_SEL_BIT,
+                     MPU6050_GCONFIG_FS_SEL_LENGTH, MPU6050_GYRO_OFFSET_FACTOR, MPU6050_INTERRUPT_FIFO_OFLOW_BIT,
+                     MPU6050_PWR1_DEVICE_RESET_BIT, MPU6050_PWR1_SLEEP_BIT, MPU6050_RA_ACCEL_CONFIG,
+                     MPU6050_RA_ACCEL_XOUT_H, MPU6050_RA_CONFIG, MPU6050_RA_FIFO_COUNTH, MPU6050_RA_FIFO_COUNTL,
+                     MPU6050_RA_FIFO_EN, MPU6050_RA_FIFO_R_W, MPU6050_RA_GYRO_CONFIG, MPU6050_RA_GYRO_ZOUT_L,
+                     MPU6050_RA_INT_STATUS, MPU6050_RA_PWR_MGMT_1, MPU6050_RA_SMPLRT_DIV, MPU6050_RA_USER_CTRL,
+                     MPU6050_RA_WHO_AM_I, MPU6050_RA_XA_OFFS_H, MPU6050_RA_XG_OFFS_USRH, MPU6050_RA_YA_OFFS_H,
+                     MPU6050_RA_YG_OFFS_USRH, MPU6050_RA_ZA_OFFS_H, MPU6050_RA_ZG_OFFS_USRH, MPU6050_TEMP_FACTOR,
+                     MPU6050_TEMP_FIFO_EN_BIT, MPU6050_TEMP_OFFSET, MPU6050_USERCTRL_DMP_RESET_BIT,
+                     MPU6050_USERCTRL_FIFO_EN_BIT, MPU6050_USERCTRL_FIFO_RESET_BIT, MPU6050_USERCTRL_I2C_MST_RESET_BIT,
+                     MPU6050_USERCTRL_SIG_COND_RESET_BIT, MPU6050_XG_FIFO_EN_BIT, MPU6050_YG_FIFO_EN_BIT,
+                     MPU6050_ZG_FIFO_EN_BIT)
+
+DEFAULT_LATENCY = 0.0
+DEFAULT_BYTE_TIME = 0.0
+MAX_BLOCK_LENGTH = 32
+FIFO_SIZE = 1024
+WHO_AM_I_VALUE = 0x68
+I2C_M_RD = 0x0001
+
+class MPU6050_Emulator:
+    def __init__(self, clock=time.monotonic, seed=None, drift=0.0):
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.accel_bias = [self.random.randint(-300, 300) for _ in range(3)]
+        self.gyro_bias = [self.random.randint(-60, 60) for _ in range(3)]
+        # relative error of the sensor oscillator, real parts are off by up to a few percent
+        self.drift = self.random.uniform(-drift, drift) if drift else 0.0
+        self.registers = bytearray(128)
+        self.fifo = bytearray()
+        self.overflows = 0
+        self.reset()
+
+    def reset(self):
+        self.registers[:] = bytes(128)
+        self.registers[MPU6050_RA_PWR_MGMT_1] = 1 << MPU6050_PWR1_SLEEP_BIT
+        self.registers[MPU6050_RA_WHO_AM_I] = WHO_AM_I_VALUE
+        self.fifo.clear()
+        self.last_sample_time = self.clock()
+
+    def get_bits(self, reg, bit, length=1):
+        return (self.registers[reg] >> (bit - length + 1)) & ((1 << length) - 1)
+
+    def get_signed_word(self, reg):
+        return struct.unpack('>h', self.registers[reg : reg + 2])[0]
+
+    @property
+    def sample_rate(self):
+        dlpf_mode = self.get_bits(MPU6050_RA_CONFIG, MPU6050_CFG_DLPF_CFG_BIT, MPU6050_CFG_DLPF_CFG_LENGTH)
+        if dlpf_mode in (0, 7):
+            gyro_output_rate = MPU6050_DEFAULT_GYRO_OUTPUT_RATE
+        else:
+            gyro_output_rate = MPU6050_DLPF_GYRO_OUTPUT_RATE
+        return gyro_output_rate * (1 + self.drift) / (1 + self.registers[MPU6050_RA_SMPLRT_DIV])
+
+    @property
+    def package_length(self):
+        fifo_en = self.registers[MPU6050_RA_FIFO_EN]
+        package_length = 0
+        if fifo_en & (1 << MPU6050_ACCEL_FIFO_EN_BIT):
+            package_length += 6
+        for bit in [MPU6050_TEMP_FIFO_EN_BIT, MPU6050_XG_FIFO_EN_BIT, MPU6050_YG_FIFO_EN_BIT, MPU6050_ZG_FIFO_EN_BIT]:
+            if fifo_en & (1 << bit):
+                package_length += 2
+        return package_length
+
+    def is_sampling(self):
+        return (not self.get_bits(MPU6050_RA_PWR_MGMT_1, MPU6050_PWR1_SLEEP_BIT)
+                and self.get_bits(MPU6050_RA_USER_CTRL, MPU6050_USERCTRL_FIFO_EN_BIT)
+                and self.package_length > 0)
+
+    def get_motion(self, t):
+        accel_lsb = 16384 >> self.get_bits(MPU6050_RA_ACCEL_CONFIG, MPU6050_ACONFIG_AFS_SEL_BIT, MPU6050_ACONFIG_AFS_SEL_LENGTH)
+        gyro_lsb = 131.0 / (1 << self.get_bits(MPU6050_RA_GYRO_CONFIG, MPU6050_GCONFIG_FS_SEL_BIT, MPU6050_GCONFIG_FS_SEL_LENGTH))
+        accel_offset_factor = MPU6050_ACCEL_OFFSET_FACTOR * accel_lsb / 16384
+        gyro_offset_factor = MPU6050_GYRO_OFFSET_FACTOR * gyro_lsb / 131.0
+        accel = [0.05 * math.sin(t), 0.05 * math.cos(t), -1.0]
+        gyro = [20 * math.sin(0.5 * t), 10 * math.cos(0.3 * t), 5 * math.sin(0.2 * t)]
+        accel_offsets = [self.get_signed_word(reg) for reg in [MPU6050_RA_XA_OFFS_H, MPU6050_RA_YA_OFFS_H, MPU6050_RA_ZA_OFFS_H]]
+        gyro_offsets = [self.get_signed_word(reg) for reg in [MPU6050_RA_XG_OFFS_USRH, MPU6050_RA_YG_OFFS_USRH, MPU6050_RA_ZG_OFFS_USRH]]
+        accel = [a * accel_lsb + b + o * accel_offset_factor + self.random.gauss(0, 4)
+                 for a, b, o in zip(accel, self.accel_bias, accel_offsets)]
+        gyro = [g * gyro_lsb + b + o * gyro_offset_factor + self.random.gauss(0, 2)
+                for g, b, o in zip(gyro, self.gyro_bias, gyro_offsets)]
+        temperature = (25.0 - MPU6050_TEMP_OFFSET) / MPU6050_TEMP_FACTOR
+        clip = lambda v: max(-32768, min(32767, int(round(v))))
+        return [clip(v) for v in accel], clip(temperature), [clip(v) for v in gyro]
+
+    def get_package(self, t):
+        fifo_en = self.registers[MPU6050_RA_FIFO_EN]
+        accel, temperature, gyro = self.get_motion(t)
+        words = []
+        if fifo_en & (1 << MPU6050_ACCEL_FIFO_EN_BIT):
+            words += accel
+        if fifo_en & (1 << MPU6050_TEMP_FIFO_EN_BIT):
+            words.append(temperature)
+        for i, bit in enumerate([MPU6050_XG_FIFO_EN_BIT, MPU6050_YG_FIFO_EN_BIT, MPU6050_ZG_FIFO_EN_BIT]):
+            if fifo_en & (1 << bit):
+                words.append(gyro[i])
+        return struct.pack(f'>{len(words)}h', *words)
+
+    def update(self):
+        now = self.clock()
+        if not self.is_sampling():
+            self.last_sample_time = now
+            return
+        sample_rate = self.sample_rate
+        n_samples = int((now - self.last_sample_time) * sample_rate)
+        if n_samples <= 0:
+            return
+        self.last_sample_time += n_samples / sample_rate
+        n_kept = min(n_samples, FIFO_SIZE // self.package_length + 1)
+        for i in range(n_samples - n_kept, n_samples):
+            self.fifo += self.get_package(self.last_sample_time - (n_samples - 1 - i) / sample_rate)
+        if len(self.fifo) > FIFO_SIZE:
+            del self.fifo[: len(self.fifo) - FIFO_SIZE]
+            self.registers[MPU6050_RA_INT_STATUS] |= 1 << MPU6050_INTERRUPT_FIFO_OFLOW_BIT
+            self.overflows += 1
+
+    def read_register(self, reg):
+        if reg == MPU6050_RA_FIFO_R_W:
+            if not self.fifo:
+                return 0
+            value = self.fifo[0]
+            del self.fifo[0]
+            return value
+        if reg == MPU6050_RA_FIFO_COUNTH:
+            return len(self.fifo) >> 8
+        if reg == MPU6050_RA_FIFO_COUNTL:
+            return len(self.fifo) & 0xFF
+        if reg == MPU6050_RA_INT_STATUS:
+            value = self.registers[reg]
+            self.registers[reg] = 0
+            return value
+        return self.registers[reg]
+
+    def read(self, reg, length):
+        self.update()
+        if reg == MPU6050_RA_FIFO_R_W:
+            result = list(self.fifo[:length])
+            del self.fifo[:length]
+            return result + [0] * (length - len(result))
+        if MPU6050_RA_ACCEL_XOUT_H <= reg <= MPU6050_RA_GYRO_ZOUT_L:
+            accel, temperature, gyro = self.get_motion(self.clock())
+            data = struct.pack('>7h', *accel, temperature, *gyro)
+            self.registers[MPU6050_RA_ACCEL_XOUT_H : MPU6050_RA_GYRO_ZOUT_L + 1] = data
+        return [self.read_register(reg + i) for i in range(length)]
+
+    def write(self, reg, values):
+        self.update()
+        for i, value in enumerate(values):
+            self.write_register(reg + i, value)
+
+    def write_register(self, reg, value):
+        if reg == MPU6050_RA_PWR_MGMT_1 and value & (1 << MPU6050_PWR1_DEVICE_RESET_BIT):
+            self.reset()
+            return
+        if reg == MPU6050_RA_USER_CTRL:
+            if value & (1 << MPU6050_USERCTRL_FIFO_RESET_BIT):
+                self.fifo.clear()
+                self.last_sample_time = self.clock()
+            value &= ~((1 << MPU6050_USERCTRL_FIFO_RESET_BIT) | (1 << MPU6050_USERCTRL_SIG_COND_RESET_BIT)
+                       | (1 << MPU6050_USERCTRL_DMP_RESET_BIT) | (1 << MPU6050_USERCTRL_I2C_MST_RESET_BIT))
+        if reg in (MPU6050_RA_WHO_AM_I, MPU6050_RA_FIFO_COUNTH, MPU6050_RA_FIFO_COUNTL, MPU6050_RA_INT_STATUS):
+            return
+        if reg == MPU6050_RA_FIFO_R_W:
+            self.fifo.append(value)
+            return
+        self.registers[reg] = value & 0xFF
+
+class I2CMessage:
+    def __init__(self, address, flags, buf):
+        self.addr = address
+        self.flags = flags
+        self.buf = bytearray(buf)
+        self.len = len(self.buf)
+
+    @staticmethod
+    def read(address, length):
+        return I2CMessage(address, I2C_M_RD, bytes(length))
+
+    @staticmethod
+    def write(address, buf):
+        return I2CMessage(address, 0, buf)
+
+    def __iter__(self):
+        return iter(self.buf[: self.len])
+
+    def __bytes__(self):
+        return bytes(self.buf[: self.len])
+
+class EmulatedSMBus:
+    def __init__(self, bus_id, latency=DEFAULT_LATENCY, byte_time=DEFAULT_BYTE_TIME, auto_attach=True, rdwr=True,
+                 drift=0.0):
+        self.bus_id = bus_id
+        self.drift = drift
+        self.i2c_msg = I2CMessage if rdwr else None
+        self.latency = latency
+        self.byte_time = byte_time
+        self.auto_attach = auto_attach
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.transactions = 0
+        self.bytes = 0
+
+    def attach(self, address, device=None):
+        if device is None:
+            device = MPU6050_Emulator(seed=(self.bus_id << 8) | address, drift=self.drift)
+        self.devices[address] = device
+        return self.devices[address]
+
+    def get_device(self, address):
+        if address not in self.devices:
+            if not self.auto_attach:
+                raise OSError(errno.EREMOTEIO, 'Remote I/O error')
+            self.attach(address)
+        return self.devices[address]
+
+    def transfer(self, n_bytes):
+        self.transactions += 1
+        self.bytes += n_bytes
+        delay = self.latency + self.byte_time * n_bytes
+        if delay > 0:
+            time.sleep(delay)
+
+    def read_byte_data(self, address, reg):
+        with self.lock:
+            self.transfer(3)
+            return self.get_device(address).read(reg, 1)[0]
+
+    def write_byte_data(self, address, reg, value):
+        with self.lock:
+            self.transfer(3)
+            self.get_device(address).write(reg, [value])
+
+    def read_i2c_block_data(self, address, reg, length=MAX_BLOCK_LENGTH):
+        if length > MAX_BLOCK_LENGTH:
+            raise OSError(errno.EINVAL, 'Invalid argument')
+        with self.lock:
+            self.transfer(2 + length)
+            return self.get_device(address).read(reg, length)
+
+    def write_i2c_block_data(self, address, reg, values):
+        if len(values) > MAX_BLOCK_LENGTH:
+            raise OSError(errno.EINVAL, 'Invalid argument')
+        with self.lock:
+            self.transfer(2 + len(values))
+            self.get_device(address).write(reg, values)
+
+    def i2c_rdwr(self, *messages):
+        if self.i2c_msg is None:
+            raise OSError(errno.EOPNOTSUPP, 'Operation not supported')
+        with self.lock:
+            self.transfer(sum(1 + message.len for message in messages))
+            reg = 0
+            for message in messages:
+                device = self.get_device(message.addr)
+                if message.flags & I2C_M_RD:
+                    message.buf[: message.len] = device.read(reg, message.len)
+                else:
+                    reg = message.buf[0]
+                    if message.len > 1:
+                        device.write(reg, list(message.buf[1 : message.len]))
+
+    def get_options(self):
+        return {
+            'latency': self.latency,
+            'byte_time': self.byte_time,
+            'auto_attach': self.auto_attach,
+            'rdwr': self.i2c_msg is not None,
+            'drift': self.drift
+        }
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes = 0
+
+EMULATED_BUSES = {}
+
+def get_bus(bus_id, **options):
+    # every sensor on a bus opens it, later opens must not ask for a differently configured bus
+    if bus_id not in EMULATED_BUSES:
+        EMULATED_BUSES[bus_id] = EmulatedSMBus(bus_id, **options)
+    bus = EMULATED_BUSES[bus_id]
+    for key, value in options.items():
+        current = bus.get_options().get(key)
+        if current != value:
+            raise ValueError(f'Emulated bus {bus_id} is already open with \'{key}\' = {current}, not {value}')
+    return bus
\ No newline at end of file
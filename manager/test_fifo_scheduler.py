@@ -0,0 +1,70 @@
+import pytest
+from fifo_scheduler import FIFO_SIZE, MAX_RATE_DEVIATION, MIN_INTERVAL, FifoScheduler
+
+BYTE_RATE = 12000.0
+WATERMARK = 0.5
+MAX_INTERVAL = 0.1
+
+def create_scheduler(keys):
+    scheduler = FifoScheduler(WATERMARK, MAX_INTERVAL)
+    for key in keys:
+        scheduler.add(key, BYTE_RATE)
+    scheduler.start(0.0)
+    return scheduler
+
+def test_invalid_watermark():
+    with pytest.raises(ValueError):
+        FifoScheduler(0)
+    with pytest.raises(ValueError):
+        FifoScheduler(1.5)
+
+def test_first_deadlines_are_spread():
+    scheduler = create_scheduler([0, 1])
+    interval = WATERMARK * FIFO_SIZE / BYTE_RATE
+    assert scheduler.next_due() == pytest.approx(interval / 2)
+    assert scheduler.pop() == 0
+    assert scheduler.next_due() == pytest.approx(interval)
+    assert scheduler.pop() == 1
+
+def test_interval_is_clamped():
+    scheduler = FifoScheduler(WATERMARK, MAX_INTERVAL)
+    scheduler.add('slow', 100.0)
+    scheduler.add('fast', 1e9)
+    assert scheduler.get_interval('slow') == MAX_INTERVAL
+    assert scheduler.get_interval('fast') == MIN_INTERVAL
+
+def test_rate_follows_observed_rate():
+    scheduler = create_scheduler([0])
+    now = scheduler.next_due()
+    scheduler.pop()
+    # the sensor clock runs 10 % fast, whole reads leave no residual
+    for _ in range(100):
+        fifo_count = int(BYTE_RATE * 1.1 * (now - scheduler.last_service[0]))
+        scheduler.update(0, now, fifo_count, fifo_count)
+        now = scheduler.next_due()
+        scheduler.pop()
+    assert scheduler.byte_rates[0] == pytest.approx(BYTE_RATE * 1.1, rel=0.01)
+    assert scheduler.get_stats() == {'services': 100, 'empty_services': 0}
+
+def test_rate_is_bounded_and_overflow_ignored():
+    scheduler = create_scheduler([0])
+    scheduler.pop()
+    for now in range(1, 50):
+        scheduler.update(0, now * 0.01, FIFO_SIZE - 1, FIFO_SIZE - 1)
+        scheduler.pop()
+    assert scheduler.byte_rates[0] == pytest.approx(BYTE_RATE * MAX_RATE_DEVIATION)
+    # a full FIFO says nothing about the rate
+    scheduler.update(0, 10.0, FIFO_SIZE, 0)
+    assert scheduler.byte_rates[0] == pytest.approx(BYTE_RATE * MAX_RATE_DEVIATION)
+    assert scheduler.n_empty == 1
+
+def test_residual_shortens_interval_until_reset():
+    scheduler = create_scheduler([0])
+    scheduler.pop()
+    scheduler.update(0, 0.01, 120, 0)
+    assert scheduler.residuals[0] == 120
+    assert scheduler.next_due() == pytest.approx(0.01 + (WATERMARK * FIFO_SIZE - 120) / scheduler.byte_rates[0])
+    scheduler.pop()
+    scheduler.reset(0, 0.02)
+    assert scheduler.residuals[0] == 0
+    assert scheduler.next_due() == pytest.approx(0.02 + scheduler.get_interval(0))
\ No newline at end of file
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import pytest
+import requests
+from session_streamer import SessionStreamer
+
+URL = 'http://client/stream'
+CHUNK_SIZE = 4
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code}: {self.body}')
+
+class FakeClient:
+    # Mirrors the /stream endpoints of the client: chunks are written by offset and may not leave a hole
+    def __init__(self):
+        self.files = {}
+        self.failures = set()
+        self.n_posts = 0
+
+    def get(self, url, params, timeout):
+        return FakeResponse({'files': {path: len(data) for path, data in self.files.items()}})
+
+    def post(self, url, params, data=None, json=None, headers=None, timeout=None):
+        self.n_posts += 1
+        if self.n_posts in self.failures:
+            raise requests.ConnectionError('connection reset')
+        if url.endswith('/commit'):
+            mismatched = [path for path, expected in json.items()
+                          if hashlib.sha256(self.files.get(path, b'')).hexdigest() != expected['sha256']]
+            return FakeResponse({'mismatched': mismatched})
+        path, offset = params['path'], params['offset']
+        if hashlib.sha256(data).hexdigest() != headers['X-Checksum']:
+            return FakeResponse({'detail': 'checksum mismatch'}, 400)
+        current = self.files.setdefault(path, bytearray())
+        if offset > len(current):
+            return FakeResponse({'detail': 'hole'}, 400)
+        current[offset:] = data
+        return FakeResponse({'size': len(current)})
+
+def create_file(tmp_path, name, data):
+    local_path = os.path.join(str(tmp_path), name)
+    with open(local_path, 'wb') as f:
+        f.write(data)
+    return local_path
+
+def test_written_bytes_are_streamed(tmp_path):
+    client = FakeClient()
+    streamer = SessionStreamer(URL, 'session', CHUNK_SIZE, http=client)
+    local_path = os.path.join(str(tmp_path), 'sensor_s0')
+    with open(local_path, 'wb') as f:
+        stream_file = streamer.wrap(f, local_path, 'raw_data/sensor_s0')
+        stream_file.write(b'0123456789')
+        streamer.upload()
+        assert client.files['raw_data/sensor_s0'] == b'0123456789'
+        stream_file.write(b'abc')
+        streamer.upload()
+    assert client.files['raw_data/sensor_s0'] == b'0123456789abc'
+    assert streamer.bytes_sent == 13
+
+def test_resume_from_acknowledged_offsets(tmp_path):
+    client = FakeClient()
+    # the third chunk is lost, so the first two are acknowledged
+    client.failures = {3}
+    streamer = SessionStreamer(URL, 'session', CHUNK_SIZE, http=client)
+    data = bytes(range(30))
+    streamer.add_file(create_file(tmp_path, 'sensor_s0', data), 'raw_data/sensor_s0', len(data))
+    with pytest.raises(requests.ConnectionError):
+        streamer.upload()
+    assert client.files['raw_data/sensor_s0'] == data[:2 * CHUNK_SIZE]
+    # the streamer thread records the failure, the next upload resumes before sending
+    streamer.error = requests.ConnectionError()
+    streamer.upload()
+    assert client.files['raw_data/sensor_s0'] == data
+    assert streamer.bytes_sent == len(data)
+    streamer.commit()
+
+def test_resume_resends_what_the_client_lost(tmp_path):
+    client = FakeClient()
+    session_dir = tmp_path / 'session'
+    os.makedirs(str(session_dir / 'raw_data'))
+    data = bytes(range(20))
+    create_file(session_dir / 'raw_data', 'sensor_s0', data)
+    streamer = SessionStreamer(URL, 'session', CHUNK_SIZE, http=client)
+    streamer.add_dir(str(session_dir))
+    streamer.upload()
+    # the client kept only part of the file, a fresh streamer for the spooled session starts from its offsets
+    del client.files['raw_data/sensor_s0'][6:]
+    streamer = SessionStreamer(URL, 'session', CHUNK_SIZE, http=client)
+    streamer.add_dir(str(session_dir))
+    streamer.resume()
+    assert streamer.entries['raw_data/sensor_s0']['sent'] == 6
+    streamer.send_pending()
+    assert client.files['raw_data/sensor_s0'] == data
+    assert streamer.bytes_sent == len(data) - 6
+
+def test_commit_reports_mismatch(tmp_path):
+    client = FakeClient()
+    streamer = SessionStreamer(URL, 'session', CHUNK_SIZE, http=client)
+    data = bytes(range(10))
+    streamer.add_file(create_file(tmp_path, 'sensor_s0', data), 'raw_data/sensor_s0', len(data))
+    streamer.upload()
+    client.files['raw_data/sensor_s0'][0] ^= 0xFF
+    with pytest.raises(ValueError):
+        streamer.commit()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import io
+import threading
+from session_writer import RingBuffer, SessionWriter
+
+CAPACITY = 10
+
+def test_ring_wraps_at_buffer_end():
+    ring = RingBuffer(CAPACITY)
+    assert ring.put(b'0123456', 7)
+    ring.consume(7)
+    # only the first length bytes are copied, the reader passes its whole buffer
+    assert ring.put(b'abcdefXYZ', 6)
+    segments = ring.peek()
+    assert [bytes(segment) for segment in segments] == [b'abc', b'def']
+    assert ring.fill == 6
+    ring.consume(6)
+    assert ring.fill == 0
+    assert bytes(ring.peek()[0]) == b''
+
+def test_ring_rejects_chunk_that_does_not_fit():
+    ring = RingBuffer(CAPACITY)
+    assert ring.put(b'01234567', 8)
+    assert not ring.put(b'abc', 3)
+    assert ring.fill == 8
+    assert [bytes(segment) for segment in ring.peek()] == [b'01234567']
+    assert ring.put(b'ab', 2)
+    assert ring.fill == CAPACITY
+
+def test_writer_counts_dropped_chunks():
+    f = io.BytesIO()
+    writer = SessionWriter([f], buffer_size=CAPACITY, flush_size=CAPACITY, flush_interval=60)
+    assert writer.push(0, b'0123', 4)
+    assert writer.push(0, b'4567', 4)
+    assert not writer.push(0, b'abc', 3)
+    assert not writer.push(0, b'abcdefghijk', 11)
+    assert writer.push(0, b'89', 2)
+    stats = writer.get_stats(['s0'])
+    assert stats['dropped_chunks'] == {'s0': 2}
+    assert stats['dropped_bytes'] == {'s0': 14}
+    assert stats['max_fill'] == {'s0': CAPACITY}
+
+def test_writer_drains_on_close():
+    # the flush interval never elapses, so everything is written by the final drain
+    files = [io.BytesIO(), io.BytesIO()]
+    writer = SessionWriter(files, buffer_size=CAPACITY, flush_size=CAPACITY, flush_interval=60)
+    writer.start()
+    writer.push(0, b'01234', 5)
+    writer.push(1, b'abc', 3)
+    writer.close()
+    assert [f.getvalue() for f in files] == [b'01234', b'abc']
+    assert writer.written == [5, 3]
+
+def test_writer_keeps_order_across_wrap_around():
+    f = io.BytesIO()
+    writer = SessionWriter([f], buffer_size=CAPACITY, flush_size=4, flush_interval=0.001)
+    writer.start()
+    chunks = [bytes([i]) * (1 + i % 3) for i in range(256)]
+    for chunk in chunks:
+        # the producer retries instead of dropping so the output must be the exact concatenation
+        while not writer.push(0, chunk, len(chunk)):
+            threading.Event().wait(0.0001)
+    writer.close()
+    assert f.getvalue() == b''.join(chunks)
+    assert writer.written == [sum(len(chunk) for chunk in chunks)]
\ No newline at end of file
@@ -0,0 +1,13 @@
+import pytest
+import smbus_emulator
+
+def test_bus_reopened_with_other_options():
+    smbus_emulator.EMULATED_BUSES.clear()
+    bus = smbus_emulator.get_bus(0, latency=0.001, rdwr=False)
+    assert smbus_emulator.get_bus(0, latency=0.001, rdwr=False) is bus
+    assert smbus_emulator.get_bus(0) is bus
+    with pytest.raises(ValueError):
+        smbus_emulator.get_bus(0, latency=0.002)
+    with pytest.raises(ValueError):
+        smbus_emulator.get_bus(0, rdwr=True)
+    smbus_emulator.EMULATED_BUSES.clear()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import os
+import pytest
+from upload_spool import UploadSpool
+
+INTERVAL = 1
+MAX_INTERVAL = 5
+
+class FakeStreamer:
+    # Fails the upload while the shared failure budget lasts
+    def __init__(self, state, session_name):
+        self.state = state
+        self.session_name = session_name
+
+    def add_dir(self, session_dir):
+        self.session_dir = session_dir
+
+    def resume(self):
+        if self.state['failures'] > 0:
+            self.state['failures'] -= 1
+            raise ConnectionError('client unreachable')
+
+    def send_pending(self):
+        pass
+
+    def commit(self):
+        self.state['uploaded'].append(self.session_name)
+
+def create_spool(tmp_path, failures):
+    state = {'failures': failures, 'uploaded': [], 'notified': []}
+    spool = UploadSpool(str(tmp_path / 'spool'), lambda session_name: FakeStreamer(state, session_name), INTERVAL,
+                        MAX_INTERVAL, state['notified'].append)
+    return spool, state
+
+def add_session(tmp_path, spool, session_name):
+    session_dir = str(tmp_path / session_name)
+    os.makedirs(os.path.join(session_dir, 'metadata'))
+    spool.add(session_dir, session_name)
+
+def test_backoff_doubles_until_upload_succeeds(tmp_path):
+    spool, state = create_spool(tmp_path, failures=4)
+    add_session(tmp_path, spool, 'session_a')
+    delays = []
+    delay = INTERVAL
+    for _ in range(5):
+        delay = spool.upload_pending(delay)
+        delays.append(delay)
+    assert delays == [2, 4, 5, 5, INTERVAL]
+    assert spool.n_failures == 4
+    assert spool.error is None
+    assert state['uploaded'] == ['session_a']
+    assert state['notified'] == ['session_a']
+    assert spool.get_pending() == []
+
+def test_failure_stops_the_pass(tmp_path):
+    spool, state = create_spool(tmp_path, failures=1)
+    add_session(tmp_path, spool, 'session_a')
+    add_session(tmp_path, spool, 'session_b')
+    assert spool.upload_pending(INTERVAL) == 2 * INTERVAL
+    assert spool.get_status()['pending'] == ['session_a', 'session_b']
+    assert 'client unreachable' in spool.get_status()['error']
+    assert spool.upload_pending(2 * INTERVAL) == INTERVAL
+    assert state['uploaded'] == ['session_a', 'session_b']
+
+def test_pending_sessions_survive_restart(tmp_path):
+    spool, _ = create_spool(tmp_path, failures=0)
+    add_session(tmp_path, spool, 'session_a')
+    spool, state = create_spool(tmp_path, failures=0)
+    assert spool.get_pending() == ['session_a']
+    spool.upload_pending(INTERVAL)
+    assert state['uploaded'] == ['session_a']
+
+def test_duplicate_session(tmp_path):
+    spool, _ = create_spool(tmp_path, failures=0)
+    add_session(tmp_path, spool, 'session_a')
+    os.makedirs(str(tmp_path / 'copy'))
+    with pytest.raises(ValueError):
+        spool.add(str(tmp_path / 'copy'), 'session_a')
\ No newline at end of file
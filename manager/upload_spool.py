@@ -0,0 +1,74 @@
+import os
+import shutil
+import threading
+
+DEFAULT_SPOOL_INTERVAL = 5
+DEFAULT_MAX_SPOOL_INTERVAL = 300
+
+class UploadSpool:
+    # Keeps sessions whose upload failed on local storage and retries them in the background until the client
+    # acknowledges them. The spool survives restarts, so sessions left from a previous run are picked up on start.
+    def __init__(self, spool_path, create_streamer, interval=DEFAULT_SPOOL_INTERVAL,
+                 max_interval=DEFAULT_MAX_SPOOL_INTERVAL, on_upload=None):
+        self.spool_path = spool_path
+        self.create_streamer = create_streamer
+        self.interval = interval
+        self.max_interval = max_interval
+        self.on_upload = on_upload
+        self.n_failures = 0
+        self.error = None
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='upload_spool', daemon=True)
+        os.makedirs(spool_path, exist_ok=True)
+
+    def start(self):
+        self.thread.start()
+
+    def add(self, session_dir, session_name):
+        spool_dir = os.path.join(self.spool_path, session_name)
+        if os.path.exists(spool_dir):
+            raise ValueError(f'Session \'{session_name}\' is already spooled')
+        shutil.move(session_dir, spool_dir)
+        self.wakeup.set()
+
+    def get_pending(self):
+        return sorted(name for name in os.listdir(self.spool_path)
+                      if os.path.isdir(os.path.join(self.spool_path, name)))
+
+    def upload(self, session_name):
+        spool_dir = os.path.join(self.spool_path, session_name)
+        stream = self.create_streamer(session_name)
+        stream.add_dir(spool_dir)
+        stream.resume()
+        stream.send_pending()
+        stream.commit()
+        shutil.rmtree(spool_dir)
+
+    def upload_pending(self, delay):
+        # returns the delay until the next pass, doubled after a failure and reset once an upload succeeds
+        for session_name in self.get_pending():
+            try:
+                self.upload(session_name)
+                self.error = None
+                delay = self.interval
+                if self.on_upload:
+                    self.on_upload(session_name)
+            except Exception as e:
+                self.n_failures += 1
+                self.error = e
+                return min(self.max_interval, delay * 2)
+        return delay
+
+    def run(self):
+        delay = self.interval
+        while True:
+            delay = self.upload_pending(delay)
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+
+    def get_status(self):
+        return {
+            'pending': self.get_pending(),
+            'failures': self.n_failures,
+            'error': None if self.error is None else str(self.error)
+        }
\ No newline at end of file